@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+#
+# load_test.py
+#
+# Runs pvrextractor.core.Core against fake Deluge components: generates
+# torrents of real archives, replays bursts of TorrentFinishedEvent to the
+# handler the plugin registers, and reports the latency from each event to the
+# torrent being released to Sonarr and Radarr, the throughput, the peak RSS and
+# how long the reactor was stalled, as JSON.
+#
+# Usage: python benchmarks/load_test.py [--bursts 3] [--torrents 10]
+#            [--archives 3] [--size-kb 1024] [--formats zip,tar.gz]
+#            [--repeat 1] [--direct] [--config '{"max_concurrent_jobs": 4}']
+#
+# Must be run on a machine with Deluge installed, from the repository root.
+# 7z and rar archives need the 7z and rar commands to be created.
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deluge.component as component  # noqa: E402
+import deluge.configmanager  # noqa: E402
+from twisted.internet import reactor, task  # noqa: E402
+from twisted.python.procutils import which  # noqa: E402
+
+from pvrextractor.core import Core  # noqa: E402
+
+# Seconds between two ticks of the reactor stall probe.
+PROBE_INTERVAL = 0.01
+# A tick later than this many seconds counts as a stall.
+STALL_THRESHOLD = 0.05
+
+FORMATS = ('zip', 'tar', 'tar.gz', '7z', 'rar')
+
+
+class FakeTorrent(object):
+    """
+    The parts of deluge.core.torrent.Torrent the plugin uses. Records when
+    the plugin sets is_finished back to True, releasing it to the PVR.
+    """
+
+    def __init__(self, torrent_id, name, location, files):
+        self.torrent_id = torrent_id
+        self.name = name
+        self.location = location
+        self.files = files
+        self.options = {'sequential_download': False}
+        self.emitted_at = None
+        self.released_at = None
+        self._is_finished = False
+
+    @property
+    def is_finished(self):
+        return self._is_finished
+
+    @is_finished.setter
+    def is_finished(self, value):
+        if value and not self._is_finished and self.emitted_at is not None:
+            self.released_at = time.time()
+        self._is_finished = value
+
+    def finish(self, emit=True):
+        """
+        Records the time the torrent first finished and, when an event is
+        emitted for it, sets is_finished the way Deluge does beforehand.
+        """
+        if emit:
+            self._is_finished = True
+        if self.emitted_at is None:
+            self.emitted_at = time.time()
+
+    def get_status(self, keys):
+        return {
+            'name': self.name,
+            'download_location': self.location,
+            'progress': 100.0,
+        }
+
+    def get_files(self):
+        return [dict(f, index=index) for index, f in enumerate(self.files)]
+
+    def get_file_progress(self):
+        return [1.0] * len(self.files)
+
+    def set_sequential_download(self, value):
+        self.options['sequential_download'] = value
+
+
+class FakeTorrentManager(component.Component):
+    def __init__(self):
+        component.Component.__init__(self, 'TorrentManager')
+        self.torrents = {}
+
+
+class FakeEventManager(component.Component):
+    def __init__(self):
+        component.Component.__init__(self, 'EventManager')
+        self.handlers = {}
+
+    def register_event_handler(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def deregister_event_handler(self, event, handler):
+        if handler in self.handlers.get(event, []):
+            self.handlers[event].remove(handler)
+
+    def emit(self, event, *args):
+        for handler in list(self.handlers.get(event, [])):
+            handler(*args)
+
+
+class FakeCorePluginManager(component.Component):
+    def __init__(self):
+        component.Component.__init__(self, 'CorePluginManager')
+        self.labels = {}
+
+    def get_status(self, torrent_id, keys):
+        return {'label': self.labels.get(torrent_id, '')}
+
+
+class FakeRPCServer(component.Component):
+    def __init__(self):
+        component.Component.__init__(self, 'RPCServer')
+
+    def register_object(self, obj, name=None):
+        pass
+
+    def deregister_object(self, obj):
+        pass
+
+
+class StallProbe(object):
+    """Measures how late the reactor runs a call scheduled every interval."""
+
+    def __init__(self, interval=PROBE_INTERVAL, threshold=STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_delay = 0.0
+        self.stalled = 0.0
+        self.stalls = 0
+        self._last = None
+        self._loop = task.LoopingCall(self._tick)
+
+    def start(self):
+        self._last = time.time()
+        self._loop.start(self.interval, now=False)
+
+    def stop(self):
+        if self._loop.running:
+            self._loop.stop()
+
+    def _tick(self):
+        now = time.time()
+        delay = max(0.0, now - self._last - self.interval)
+        self._last = now
+        self.max_delay = max(self.max_delay, delay)
+        if delay > self.threshold:
+            self.stalls += 1
+            self.stalled += delay
+
+    def get_status(self):
+        return {
+            'max_stall_ms': round(self.max_delay * 1000, 1),
+            'stall_time_ms': round(self.stalled * 1000, 1),
+            'stalls': self.stalls,
+        }
+
+
+def write_payload(path, size):
+    """Writes size bytes of half random, half compressible data to path."""
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size // 2))
+        f.write(b'\0' * (size - size // 2))
+
+
+def create_archive(folder, name, archive_format, size):
+    """Creates an archive of one payload file in folder, returns its path."""
+    payload_dir = tempfile.mkdtemp(dir=folder)
+    member = os.path.join(payload_dir, name + '.bin')
+    write_payload(member, size)
+    archive = os.path.join(folder, '%s.%s' % (name, archive_format))
+    try:
+        if archive_format == 'zip':
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+                z.write(member, os.path.basename(member))
+        elif archive_format in ('tar', 'tar.gz'):
+            mode = 'w:gz' if archive_format == 'tar.gz' else 'w'
+            with tarfile.open(archive, mode) as t:
+                t.add(member, os.path.basename(member))
+        elif archive_format == '7z':
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call(
+                    [find_tool('7z', '7za', '7zr'), 'a', '-bd', archive,
+                     os.path.basename(member)],
+                    cwd=payload_dir, stdout=devnull,
+                )
+        else:
+            subprocess.check_call(
+                [find_tool('rar'), 'a', '-idq', archive,
+                 os.path.basename(member)],
+                cwd=payload_dir,
+            )
+    finally:
+        shutil.rmtree(payload_dir)
+    return archive
+
+
+def find_tool(*names):
+    for name in names:
+        found = which(name)
+        if found:
+            return found[0]
+    return None
+
+
+def generate_torrents(root, count, archives, size, formats, first=0):
+    """Creates count torrents of archives each, cycling through formats."""
+    torrents = []
+    for number in range(first, first + count):
+        torrent_id = '%040x' % number
+        name = 'Load.Test.S01E%04d' % number
+        folder = os.path.join(root, name)
+        os.makedirs(folder)
+        files = []
+        for index in range(archives):
+            archive_format = formats[(number + index) % len(formats)]
+            path = create_archive(folder, 'part%03d' % index, archive_format,
+                                  size)
+            files.append({
+                'path': os.path.relpath(path, root),
+                'size': os.path.getsize(path),
+            })
+        video = os.path.join(folder, 'video.mkv')
+        write_payload(video, 4096)
+        files.append({'path': os.path.relpath(video, root), 'size': 4096})
+        torrents.append(FakeTorrent(torrent_id, name, root, files))
+    return torrents
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def peak_rss():
+    """Returns the peak RSS in bytes of this process and of its children."""
+    if resource is None:
+        return None, None
+    # Kilobytes on Linux, bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    )
+
+
+class LoadTest(object):
+    def __init__(self, core, event_manager, bursts, interval, repeat, direct,
+                 timeout):
+        self.core = core
+        self.event_manager = event_manager
+        self.bursts = bursts
+        self.interval = interval
+        self.repeat = repeat
+        self.direct = direct
+        self.timeout = timeout
+        self.probe = StallProbe()
+        self.started_at = None
+        self.ended_at = None
+        self.timed_out = False
+        self._check = task.LoopingCall(self._check_done)
+        self._timeout = None
+
+    @property
+    def torrents(self):
+        return [torrent for burst in self.bursts for torrent in burst]
+
+    def run(self):
+        reactor.callWhenRunning(self._start)
+        reactor.run()
+
+    def _start(self):
+        self.started_at = time.time()
+        self.probe.start()
+        for index, burst in enumerate(self.bursts):
+            reactor.callLater(index * self.interval, self._fire, burst)
+        self._check.start(0.1, now=False)
+        self._timeout = reactor.callLater(self.timeout, self._on_timeout)
+
+    def _fire(self, burst):
+        for _ in range(self.repeat):
+            for torrent in burst:
+                torrent.finish(emit=not self.direct)
+                if self.direct:
+                    self.core._on_torrent_finished(torrent.torrent_id)
+                else:
+                    self.event_manager.emit(
+                        'TorrentFinishedEvent', torrent.torrent_id
+                    )
+
+    def _check_done(self):
+        if all(torrent.released_at for torrent in self.torrents):
+            self._stop()
+
+    def _on_timeout(self):
+        self.timed_out = True
+        self._stop()
+
+    def _stop(self):
+        self.ended_at = time.time()
+        self._check.stop()
+        if self._timeout.active():
+            self._timeout.cancel()
+        self.probe.stop()
+        reactor.stop()
+
+    def get_results(self):
+        torrents = self.torrents
+        released = [torrent for torrent in torrents if torrent.released_at]
+        latencies = [torrent.released_at - torrent.emitted_at
+                     for torrent in released]
+        archives = sum(len(torrent.files) - 1 for torrent in released)
+        bytes_in = sum(
+            f['size'] for torrent in released for f in torrent.files[:-1]
+        )
+        wall_time = self.ended_at - self.started_at
+        rss, children_rss = peak_rss()
+        stats = self.core.get_stats()['total']
+
+        return {
+            'torrents': len(torrents),
+            'released': len(released),
+            'timed_out': self.timed_out,
+            'wall_time': round(wall_time, 3),
+            'latency': {
+                'min': min(latencies) if latencies else None,
+                'mean': sum(latencies) / len(latencies) if latencies else None,
+                'p50': percentile(latencies, 0.5),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': max(latencies) if latencies else None,
+            },
+            'throughput': {
+                'torrents_per_s': len(released) / wall_time,
+                'archives_per_s': archives / wall_time,
+                'mb_in_per_s': bytes_in / wall_time / 1024 ** 2,
+            },
+            'peak_rss': rss,
+            'peak_children_rss': children_rss,
+            'reactor': self.probe.get_status(),
+            'jobs': stats['jobs'],
+            'bytes_in': stats['bytes_in'],
+            'bytes_out': stats['bytes_out'],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay bursts of finished torrents against the plugin.'
+    )
+    parser.add_argument('--bursts', type=int, default=3,
+                        help='number of bursts of finished torrents')
+    parser.add_argument('--burst-interval', type=float, default=5,
+                        help='seconds between the start of two bursts')
+    parser.add_argument('--torrents', type=int, default=10,
+                        help='torrents finishing in every burst')
+    parser.add_argument('--archives', type=int, default=3,
+                        help='archives in every torrent')
+    parser.add_argument('--size-kb', type=int, default=1024,
+                        help='size of the file in every archive')
+    parser.add_argument('--formats', default='zip,tar.gz',
+                        help='comma separated archive formats among %s'
+                        % ', '.join(FORMATS))
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='events per torrent in a burst, as on a recheck')
+    parser.add_argument('--direct', action='store_true',
+                        help='call Core._on_torrent_finished, as the backlog '
+                        'scan does, instead of emitting the event to the '
+                        'registered handler')
+    parser.add_argument('--config', default='{}',
+                        help='plugin config options as a JSON object')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds before giving up on the extractions')
+    parser.add_argument('--dir', default=None,
+                        help='directory to create the torrents in')
+    parser.add_argument('--output', default=None,
+                        help='file to write the JSON report to')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the log of the plugin')
+    args = parser.parse_args()
+
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    for archive_format in formats:
+        if archive_format not in FORMATS:
+            parser.error('unknown archive format %s' % archive_format)
+    if '7z' in formats and not find_tool('7z', '7za', '7zr'):
+        parser.error('7z archives need 7z, 7za or 7zr to be installed')
+    if 'rar' in formats and not find_tool('rar'):
+        parser.error('rar archives need rar to be installed')
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s %(levelname)s %(name)s %(message)s',
+    )
+    if not args.verbose:
+        # The config files of the fresh config directory do not exist yet.
+        logging.getLogger('deluge.config').setLevel(logging.ERROR)
+
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        config_dir = os.path.join(workdir, 'config')
+        download_dir = os.path.join(workdir, 'downloads')
+        os.makedirs(config_dir)
+        os.makedirs(download_dir)
+        deluge.configmanager.set_config_dir(config_dir)
+        deluge.configmanager.ConfigManager(
+            'core.conf', {'download_location': download_dir}
+        ).save()
+
+        torrent_manager = FakeTorrentManager()
+        event_manager = FakeEventManager()
+        FakeCorePluginManager()
+        FakeRPCServer()
+
+        bursts = [
+            generate_torrents(download_dir, args.torrents, args.archives,
+                              args.size_kb * 1024, formats,
+                              index * args.torrents)
+            for index in range(args.bursts)
+        ]
+        for burst in bursts:
+            for torrent in burst:
+                torrent_manager.torrents[torrent.torrent_id] = torrent
+
+        core = Core('PVRExtractor')
+        core.enable()
+        # Torrents are released to the PVR by setting is_finished, which is
+        # how the end of their extraction is seen.
+        config = dict(json.loads(args.config), sonarr_radarr_support=True)
+        core.set_config(config)
+
+        load_test = LoadTest(core, event_manager, bursts, args.burst_interval,
+                             args.repeat, args.direct, args.timeout)
+        load_test.run()
+        core.disable()
+
+        results = load_test.get_results()
+        results['parameters'] = dict(vars(args), formats=formats,
+                                     config=config)
+    finally:
+        shutil.rmtree(workdir)
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+#
+# plan_torrent.py
+#
+# Compares the time taken to sort the files of a torrent with many files into
+# archives and other files with the per-file matching pvrextractor.core used
+# before the planner, which matched every file up to three times, against
+# pvrextractor.planner, which plans the whole torrent in a single pass.
+#
+# Usage: python benchmarks/plan_torrent.py [--files 50000] [--runs 5]
+#
+# Must be run on a machine with Deluge installed, from the repository root.
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import errno
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pvrextractor import planner  # noqa: E402
+from pvrextractor.core import EXTRACT_COMMANDS  # noqa: E402
+
+PLAIN_EXTENSIONS = ['.mkv', '.nfo', '.srt', '.jpg', '.sfv', '.txt']
+
+OLD_VOLUME_RE = re.compile(r'^(.*)\.([r-z])(\d\d)$', re.IGNORECASE)
+
+
+def generate_files(count, seed=0):
+    """
+    Returns count file dicts like those of torrent.get_files, a season pack
+    mixing `.partNN.rar` sets, `.rar` and `.rNN` sets, `.7z.NNN` splits,
+    zip archives and plain files.
+    """
+    rng = random.Random(seed)
+    files = []
+    episode = 0
+    while len(files) < count:
+        episode += 1
+        folder = 'Show.S01.1080p/Show.S01E%04d.1080p' % episode
+        kind = rng.choice(['part', 'old', 'split', 'zip', 'plain'])
+        volumes = rng.randint(5, 60)
+        if kind == 'part':
+            names = ['show.e%04d.part%02d.rar' % (episode, number)
+                     for number in range(1, volumes + 1)]
+        elif kind == 'old':
+            names = ['show.e%04d.rar' % episode] + [
+                'show.e%04d.r%02d' % (episode, number)
+                for number in range(volumes - 1)
+            ]
+        elif kind == 'split':
+            names = ['show.e%04d.7z.%03d' % (episode, number)
+                     for number in range(1, volumes + 1)]
+        elif kind == 'zip':
+            names = ['show.e%04d.zip' % episode]
+        else:
+            names = ['show.e%04d%s' % (episode, ext)
+                     for ext in PLAIN_EXTENSIONS]
+        names += ['show.e%04d.nfo' % episode, 'Sample/sample.mkv']
+
+        for name in names:
+            files.append({
+                'index': len(files),
+                'path': '%s/%s' % (folder, name),
+                'size': rng.randint(1, 50) * 1024 * 1024,
+            })
+    return files[:count]
+
+
+def legacy_split_volume(file_path):
+    """split_volume of pvrextractor.core."""
+    file_root, file_ext = os.path.splitext(file_path)
+    set_root, file_ext_sec = os.path.splitext(file_root)
+
+    if file_ext == '.rar' and 'part' in file_ext_sec:
+        part_num = file_ext_sec.split('part')[1]
+        if part_num.isdigit():
+            return set_root, int(part_num)
+    return None, None
+
+
+def legacy_find_extract_command(file_path):
+    """The per-file matching of Core._find_extract_command before planning."""
+    file_root, file_ext = os.path.splitext(file_path)
+    file_ext_sec = os.path.splitext(file_root)[1]
+    volume_number = legacy_split_volume(file_path)[1]
+
+    if file_ext_sec and file_ext_sec + file_ext in EXTRACT_COMMANDS:
+        return EXTRACT_COMMANDS[file_ext_sec + file_ext]
+    elif volume_number is not None and volume_number != 1:
+        return None
+    elif file_ext in EXTRACT_COMMANDS:
+        return EXTRACT_COMMANDS[file_ext]
+    return None
+
+
+def find_destination_path(extract_path):
+    """The exists, isdir and makedirs of Core._find_destination_path."""
+    if not os.path.exists(extract_path) or os.path.isdir(extract_path):
+        try:
+            os.makedirs(extract_path)
+        except OSError as ex:
+            if not (ex.errno == errno.EEXIST and os.path.isdir(extract_path)):
+                raise
+    return extract_path
+
+
+def legacy_is_archive_file(file_path):
+    """Core._is_archive_file before planning."""
+    return legacy_split_volume(file_path)[1] is not None or \
+        OLD_VOLUME_RE.match(os.path.basename(file_path)) is not None or \
+        legacy_find_extract_command(file_path) is not None
+
+
+def run_legacy(files, destination):
+    """
+    Core._on_torrent_finished and Core._extract_torrent before planning: a
+    pass finding the archives, then one sorting out the other files.
+    """
+    sources = [
+        file['path'] for file in files
+        if legacy_find_extract_command(file['path'])
+    ]
+    if sources:
+        find_destination_path(destination)
+
+    archives = []
+    other_files = []
+    for file in files:
+        if not legacy_is_archive_file(file['path']):
+            other_files.append(file['path'])
+        command = legacy_find_extract_command(file['path'])
+        if command is not None:
+            archives.append((file['path'], command))
+    return len(archives)
+
+
+def run_planner(files, destination):
+    plan = planner.plan_torrent(
+        files, planner.ExtensionIndex(EXTRACT_COMMANDS)
+    )
+    if plan.archives:
+        find_destination_path(destination)
+    return len(plan.archives)
+
+
+def time_best(func, runs, *args):
+    """Returns the best wall time of runs calls and the result of func."""
+    best = None
+    for _ in range(runs):
+        start = time.time()
+        result = func(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare per-file matching with the torrent planner.'
+    )
+    parser.add_argument('--files', type=int, default=50000,
+                        help='number of files of the synthetic torrent')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='runs per implementation, the best one is kept')
+    parser.add_argument('--dir', default=None,
+                        help='directory to create the destination in')
+    args = parser.parse_args()
+
+    files = generate_files(args.files)
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        destination = os.path.join(workdir, 'Show.S01.1080p')
+        legacy, legacy_archives = time_best(
+            run_legacy, args.runs, files, destination
+        )
+        planned, planned_archives = time_best(
+            run_planner, args.runs, files, destination
+        )
+    finally:
+        shutil.rmtree(workdir)
+
+    print('%d files' % len(files))
+    print('%-10s %10s %9s' % ('matcher', 'archives', 'time'))
+    print('%-10s %10d %8.1fms' % ('per-file', legacy_archives, legacy * 1000))
+    print('%-10s %10d %8.1fms' % ('planner', planned_archives,
+                                  planned * 1000))
+    print('speedup %.2fx' % (legacy / planned))
+
+
+if __name__ == '__main__':
+    main()
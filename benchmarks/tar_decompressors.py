@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+#
+# tar_decompressors.py
+#
+# Compares the wall time of extracting compressed tarballs with the plain tar
+# commands against the parallel decompressors picked by pvrextractor.core.
+#
+# Usage: python benchmarks/tar_decompressors.py [--size-mb 256] [--runs 3]
+#
+# Must be run on a machine with Deluge installed, from the repository root.
+#
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pvrextractor.core import EXTRACT_COMMANDS  # noqa: E402
+
+# Single threaded commands the plugin used before parallel decompressors.
+PLAIN_COMMANDS = {
+    '.tar.gz': ['tar', '-xzf'],
+    '.tar.bz2': ['tar', '-xjf'],
+    '.tar.xz': ['tar', '--xz -xf'],
+    '.tar.zst': ['tar', '--zstd -xf'],
+}
+
+# Flags used to create the archives with tar.
+CREATE_FLAGS = {
+    '.tar.gz': '-czf',
+    '.tar.bz2': '-cjf',
+    '.tar.xz': '--xz -cf',
+    '.tar.zst': '--zstd -cf',
+}
+
+
+def generate_payload(path, size_mb):
+    """Writes size_mb of half random, half compressible data to path."""
+    os.makedirs(path)
+    chunk = 1024 * 1024
+    for index in range(max(1, size_mb // 64)):
+        with open(os.path.join(path, 'file%03d.bin' % index), 'wb') as f:
+            for _ in range(min(64, size_mb)):
+                f.write(os.urandom(chunk // 2))
+                f.write(b'\0' * (chunk // 2))
+
+
+def create_archive(workdir, payload, ext):
+    archive = os.path.join(workdir, 'payload' + ext)
+    subprocess.check_call(
+        ['tar'] + shlex.split(CREATE_FLAGS[ext]) + [archive, 'payload'],
+        cwd=workdir,
+        env=dict(os.environ, XZ_OPT='-T0', ZSTD_NBTHREADS='0'),
+    )
+    return archive
+
+
+def time_extract(command, archive, runs):
+    """Returns the best wall time of extracting archive with command."""
+    best = None
+    for _ in range(runs):
+        target = tempfile.mkdtemp(dir=os.path.dirname(archive))
+        start = time.time()
+        subprocess.check_call(
+            [command[0]] + shlex.split(command[1]) + [archive], cwd=target
+        )
+        elapsed = time.time() - start
+        shutil.rmtree(target)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare plain and parallel tarball decompression.'
+    )
+    parser.add_argument('--size-mb', type=int, default=256,
+                        help='uncompressed size of the generated archives')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='extractions per command, the best one is kept')
+    parser.add_argument('--dir', default=None,
+                        help='directory to create the archives in')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        payload = os.path.join(workdir, 'payload')
+        generate_payload(payload, args.size_mb)
+
+        print('%-10s %-40s %8s %8s %8s' % (
+            'format', 'command', 'plain', 'plugin', 'speedup'
+        ))
+        for ext, plain_command in sorted(PLAIN_COMMANDS.items()):
+            command = EXTRACT_COMMANDS.get(ext)
+            if command is None:
+                print('%-10s not supported on this system' % ext)
+                continue
+
+            archive = create_archive(workdir, payload, ext)
+            plain = time_extract(plain_command, archive, args.runs)
+            plugin = time_extract(command, archive, args.runs)
+            print('%-10s %-40s %7.2fs %7.2fs %7.2fx' % (
+                ext, ' '.join(command), plain, plugin, plain / plugin
+            ))
+            os.remove(archive)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,25 +40,126 @@
 from __future__ import unicode_literals
 
 import errno
+import itertools
 import logging
 import os
+import shlex
+import tempfile
+import time
+from collections import Counter, OrderedDict, deque
 
 import deluge.component as component
 import deluge.configmanager
-from deluge.common import windows_check
+from deluge.common import fsize, windows_check
 from deluge.core.rpcserver import export
 from deluge.plugins.pluginbase import CorePluginBase
-from twisted.internet.utils import getProcessOutputAndValue
+from twisted.internet import reactor, task
+from twisted.internet.defer import (
+    Deferred,
+    gatherResults,
+    maybeDeferred,
+    succeed,
+)
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
 from twisted.python.procutils import which
 
+from . import engine, fileops, planner, rarcheck
+from .journal import Journal
+from .listing import ArchiveLister
+from .members import MemberFilter, tool_name
+from .metrics import JOB_SKIPPED, ExtractMetrics, MetricsExporter
+from .notifier import PVRNotifier
+from .pipeline import VolumePipeline, make_link_dir
+from .process import priority_wrapper, read_process_io, spawn_extractor
+
 KEY_TOTAL = 'total'
 KEY_COMPLETED = 'completed'
+KEY_NESTED_BYTES = 'nested_bytes'
+KEY_TARGET = 'target'
+KEY_LABEL = 'label'
+
+JOURNAL_FILE = 'pvr_extractor.db'
+
+# Torrents checked by the backlog scan before yielding to the reactor.
+SCAN_BATCH_SIZE = 20
+# Seconds TorrentFinishedEvents are collected for before being handled, so a
+# torrent finishing several times in a row, as on a recheck, is handled once.
+FINISHED_EVENT_WINDOW = 2
+
+# Prefix of the per-job directories created in the staging path.
+STAGING_PREFIX = 'pvrextractor-staging-'
+
+# Seconds before a job deferred for lack of free space is tried again.
+FREE_SPACE_RETRY_DELAY = 300
+
+# Error of the jobs stopped because the plugin was disabled.
+CANCELLED_ERROR = 'Cancelled, the plugin was disabled'
+
+# Seconds between checks of the running jobs for timeouts.
+WATCHDOG_INTERVAL = 30
+# Seconds before the first retry of a failed job, doubled on every retry.
+RETRY_DELAY = 60
+# Exit codes of failures worth retrying: open, write and memory errors.
+TRANSIENT_EXIT_CODES = {
+    'unrar': (5, 6, 8),
+    '7z': (8,),
+    '7zr': (8,),
+}
 
 CONFIG_EXTRACT_PATH = 'extract_path'
 CONFIG_SUPPORTED_LABELS = 'supported_labels'
 CONFIG_NAME_FOLDER = 'use_name_folder'
 CONFIG_IN_PLACE_EXTRACT = 'in_place_extraction'
 CONFIG_PVR_SUPPORT = 'sonarr_radarr_support'
+CONFIG_MAX_JOBS = 'max_concurrent_jobs'
+CONFIG_JOB_ORDER = 'job_order'
+CONFIG_LABEL_PRIORITY = 'label_priority'
+CONFIG_MAX_JOBS_PER_DEVICE = 'max_jobs_per_device'
+CONFIG_DEVICE_LIMITS = 'device_limits'
+CONFIG_ENGINE = 'extract_engine'
+CONFIG_ENGINE_THREADS = 'engine_threads'
+CONFIG_PIPELINE = 'pipelined_extraction'
+CONFIG_BACKLOG_SCAN = 'backlog_scan'
+CONFIG_STAGING_PATH = 'staging_path'
+CONFIG_FREE_SPACE = 'free_space_check'
+CONFIG_JOB_TIMEOUT = 'job_timeout'
+CONFIG_STALL_TIMEOUT = 'stall_timeout'
+CONFIG_MAX_RETRIES = 'max_retries'
+CONFIG_NICE_LEVEL = 'nice_level'
+CONFIG_IONICE_CLASS = 'ionice_class'
+CONFIG_IONICE_LEVEL = 'ionice_level'
+CONFIG_CGROUP_PATH = 'cgroup_path'
+CONFIG_CGROUP_CPU_MAX = 'cgroup_cpu_max'
+CONFIG_CGROUP_IO_MAX = 'cgroup_io_max'
+CONFIG_NESTED_DEPTH = 'nested_depth'
+CONFIG_NESTED_MAX_BYTES = 'nested_max_bytes'
+CONFIG_INCLUDE_MEMBERS = 'include_members'
+CONFIG_EXCLUDE_MEMBERS = 'exclude_members'
+CONFIG_LINK_FILES = 'link_other_files'
+CONFIG_DEDUPLICATE = 'deduplicate_archives'
+CONFIG_PVR_SERVERS = 'pvr_servers'
+CONFIG_METRICS_FILE = 'metrics_file'
+CONFIG_METRICS_PORT = 'metrics_port'
+
+FREE_SPACE_OFF = 'off'
+FREE_SPACE_DEFER = 'defer'
+FREE_SPACE_REJECT = 'reject'
+
+ENGINE_EXTERNAL = 'external'
+ENGINE_INTERNAL = 'internal'
+
+JOB_ORDER_FIFO = 'fifo'
+JOB_ORDER_SMALLEST = 'smallest_first'
+JOB_ORDER_LABEL = 'label'
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# Number of finished jobs kept around for get_jobs.
+KEEP_FINISHED_JOBS = 100
 
 DEFAULT_PREFS = {
     CONFIG_EXTRACT_PATH: '',
@@ -66,6 +167,35 @@ DEFAULT_PREFS = {
     CONFIG_NAME_FOLDER: True,
     CONFIG_IN_PLACE_EXTRACT: True,
     CONFIG_PVR_SUPPORT: True,
+    CONFIG_MAX_JOBS: 2,
+    CONFIG_JOB_ORDER: JOB_ORDER_FIFO,
+    CONFIG_LABEL_PRIORITY: '',
+    CONFIG_MAX_JOBS_PER_DEVICE: 0,
+    CONFIG_DEVICE_LIMITS: {},
+    CONFIG_ENGINE: ENGINE_EXTERNAL,
+    CONFIG_ENGINE_THREADS: engine.DEFAULT_THREADS,
+    CONFIG_PIPELINE: False,
+    CONFIG_BACKLOG_SCAN: False,
+    CONFIG_STAGING_PATH: '',
+    CONFIG_FREE_SPACE: FREE_SPACE_REJECT,
+    CONFIG_JOB_TIMEOUT: 0,
+    CONFIG_STALL_TIMEOUT: 900,
+    CONFIG_MAX_RETRIES: 2,
+    CONFIG_NICE_LEVEL: 10,
+    CONFIG_IONICE_CLASS: 'best-effort',
+    CONFIG_IONICE_LEVEL: 7,
+    CONFIG_CGROUP_PATH: '',
+    CONFIG_CGROUP_CPU_MAX: '',
+    CONFIG_CGROUP_IO_MAX: '',
+    CONFIG_NESTED_DEPTH: 0,
+    CONFIG_NESTED_MAX_BYTES: 50 * 1024 ** 3,
+    CONFIG_INCLUDE_MEMBERS: '',
+    CONFIG_EXCLUDE_MEMBERS: '',
+    CONFIG_LINK_FILES: False,
+    CONFIG_DEDUPLICATE: False,
+    CONFIG_PVR_SERVERS: [],
+    CONFIG_METRICS_FILE: '',
+    CONFIG_METRICS_PORT: 0,
 }
 
 EXTRACT_COMMANDS = {}
@@ -94,7 +224,7 @@ if windows_check():
         winreg.CloseKey(hkey)
         win_7z_exes.insert(1, win_7z_path)
 
-    switch_7z = 'x -y'
+    switch_7z = 'x -y -bsp1'
     ## Future suport:
     ## 7-zip cannot extract tar.* with single command.
     #    ".tar.gz", ".tgz",
@@ -128,7 +258,7 @@ else:
     EXTRACT_COMMANDS = {
         '.rar': ['unrar', 'x -or -y'],
         '.tar': ['tar', '-xf'],
-        '.zip': ['unzip', ''],
+        '.zip': ['unzip', '-o'],
         '.tar.gz': ['tar', '-xzf'],
         '.tgz': ['tar', '-xzf'],
         '.tar.bz2': ['tar', '-xjf'],
@@ -137,7 +267,7 @@ else:
         '.tlz': ['tar', '--lzma -xf'],
         '.tar.xz': ['tar', '--xz -xf'],
         '.txz': ['tar', '--xz -xf'],
-        '.7z': ['7zr', 'x'],
+        '.7z': ['7zr', 'x -y -bsp1'],
     }
 
     # Test command exists and if not, remove.
@@ -151,12 +281,482 @@ else:
                     )
                     del EXTRACT_COMMANDS[k]
 
+    # Multi-threaded decompressors handed to tar with --use-compress-program
+    # (-I), in order of preference. Plain tar decompresses on a single core.
+    parallel_decompressors = [
+        (['.tar.gz', '.tgz'], ['pigz']),
+        (['.tar.bz2', '.tbz'], ['lbzip2', 'pbzip2']),
+        (['.tar.xz', '.txz'], ['pixz', 'xz -T0']),
+        (['.tar.zst', '.tzst'], ['zstd -T0']),
+    ]
+
+    if '.tar' in EXTRACT_COMMANDS:
+        for exts, programs in parallel_decompressors:
+            for program in programs:
+                if which(program.split()[0]):
+                    log.debug(
+                        'Using %s to decompress %s', program, ', '.join(exts)
+                    )
+                    EXTRACT_COMMANDS.update(dict.fromkeys(exts, [
+                        'tar', '--use-compress-program="%s" -xf' % program
+                    ]))
+                    break
+
+# Zip and tar archives without an installed command are extracted in-process.
+for engine_ext in engine.EXTENSIONS:
+    if engine_ext not in EXTRACT_COMMANDS:
+        log.info('Using the in-process engine for %s', engine_ext)
+        EXTRACT_COMMANDS[engine_ext] = [engine.INTERNAL_COMMAND, '']
+
 if not EXTRACT_COMMANDS:
     raise Exception(
         'PVR EXTRACTOR: No archive extracting programs found, plugin will be disabled'
     )
 
-log.info('Supported extensions:', )
+log.info('Supported extensions: %s', ', '.join(sorted(EXTRACT_COMMANDS)))
+
+EXTENSION_INDEX = planner.ExtensionIndex(EXTRACT_COMMANDS)
+
+
+def split_list(value):
+    """Splits a comma separated config value into a list of stripped items."""
+    return list(filter(None, map(lambda i: i.strip(), value.split(','))))
+
+
+def split_volume(file_path):
+    """
+    Splits the path of a `.partN.rar` volume into the path of the volume set
+    without the part number and the volume number. Returns (None, None) for
+    any other file.
+    """
+    file_root, file_ext = os.path.splitext(file_path)
+    set_root, file_ext_sec = os.path.splitext(file_root)
+
+    if file_ext == '.rar' and 'part' in file_ext_sec:
+        part_num = file_ext_sec.split('part')[1]
+        if part_num.isdigit():
+            return set_root, int(part_num)
+    return None, None
+
+
+def get_device(path):
+    """
+    Returns the id of the device holding path, or of its closest existing
+    parent, or None when it cannot be determined.
+    """
+    while path:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+    return None
+
+
+def get_devices(paths):
+    """Maps each of the given paths to its device id, see get_device."""
+    return dict((path, get_device(path)) for path in paths if path)
+
+
+def is_extracted(manifest):
+    """
+    Returns whether the archive of a manifest entry is unchanged since it was
+    extracted and the files it was extracted to are all still there.
+    """
+    try:
+        stat = os.stat(manifest.source)
+    except OSError:
+        return False
+    if stat.st_size != manifest.size or stat.st_mtime != manifest.mtime:
+        return False
+    return has_outputs(manifest)
+
+
+def has_outputs(manifest):
+    """Returns whether the files of a manifest entry are all still there."""
+    try:
+        return all(
+            os.path.getsize(path) == size for path, size in manifest.outputs
+        )
+    except OSError:
+        return False
+
+
+def content_key(source):
+    """
+    Returns a key identifying the content of an archive: the size of all its
+    volumes and a hash of the start and end of its first volume.
+    """
+    if rarcheck.is_rar(source):
+        volumes = [path for number, path in rarcheck.find_volumes(source)]
+    else:
+        volumes = [source]
+    size = sum(os.path.getsize(path) for path in volumes)
+    return '%d:%s' % (size, fileops.partial_hash(source))
+
+
+def archive_format(job):
+    """
+    Returns the extension of the archive of a job without its leading dot,
+    or the name of its tool for numbered split volumes.
+    """
+    ext = EXTENSION_INDEX.find(os.path.basename(job.source))[0]
+    return ext[1:] if ext else tool_name(job.command)
+
+
+def link_outputs(manifests, target):
+    """
+    Links the files the first of the manifest entries whose files are all
+    still there was extracted to into target, and returns that entry. Returns
+    None when none of them is left.
+    """
+    for manifest in manifests:
+        if not has_outputs(manifest):
+            continue
+        for path, size in manifest.outputs:
+            fileops.link_file(path, os.path.join(
+                target, os.path.relpath(path, manifest.target)
+            ))
+        return manifest
+    return None
+
+
+class RetryJob(Exception):
+    """Raised by a job runner to run the job again after delay seconds."""
+
+    def __init__(self, message, delay):
+        super(RetryJob, self).__init__(message)
+        self.delay = delay
+
+
+class ExtractJob(object):
+    """A single archive extraction, queued or running on the scheduler."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, counts, torrent, command, source, target, label='',
+                 size=0, name='', staging='', depth=0, devices=None,
+                 volumes=None):
+        self.job_id = next(self._ids)
+        self.counts = counts
+        self.torrent = torrent
+        self.command = command
+        self.source = source
+        self.target = target
+        self.label = label
+        self.size = size
+        self.staging = staging
+        self.depth = depth
+        # Index and path in the torrent of the volumes of the archive, None
+        # when they are not known, for resumed jobs.
+        self.volumes = volumes
+        self.max_bytes = None
+        self.work_dir = None
+        # Devices are looked up off the reactor by the callers when they can,
+        # a stalled filesystem blocks the stat.
+        devices = devices or {}
+        self.devices = set(filter(
+            lambda dev: dev is not None,
+            (devices[path] if path in devices else get_device(path)
+             for path in (source, target, staging) if path)
+        ))
+        self.name = name
+        self.state = JOB_QUEUED
+        self.progress = None
+        self.bytes_written = 0
+        self.error = ''
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.protocol = None
+        self.skipped = False
+        self.content_key = None
+        self.pipeline = None
+        self.cancelled = False
+        self.attempts = 0
+        self.timed_out = None
+        self.stalled = False
+        self.io_activity = None
+        self.revision = 0
+        self.deferred = Deferred()
+
+    @property
+    def torrent_id(self):
+        return self.torrent.torrent_id
+
+    @property
+    def extract_path(self):
+        """Where the archive is extracted to, its staging directory if any."""
+        return self.work_dir or self.target
+
+    def get_status(self):
+        return {
+            'id': self.job_id,
+            'torrent_id': self.torrent_id,
+            'name': self.name,
+            'archive': os.path.basename(self.source),
+            'target': self.target,
+            'label': self.label,
+            'size': self.size,
+            'state': self.state,
+            'progress': self.progress,
+            'bytes_written': self.bytes_written,
+            'error': self.error,
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobRegistry(object):
+    """
+    Keeps track of the extraction jobs for reporting over RPC.
+
+    Every change to a job is stamped with an increasing revision so clients
+    can poll for the jobs changed since the last revision they have seen
+    instead of fetching every job each time. State changes are also written
+    to the journal, when there is one.
+    """
+
+    def __init__(self, keep_finished=KEEP_FINISHED_JOBS, journal=None):
+        self.keep_finished = keep_finished
+        self.journal = journal
+        self.revision = 0
+
+        self._jobs = OrderedDict()
+        self._finished = deque()
+        # Revision and id of the jobs dropped from the registry.
+        self._removed = deque(maxlen=keep_finished)
+
+    def __iter__(self):
+        return iter(list(self._jobs.values()))
+
+    def add(self, job):
+        self._jobs[job.job_id] = job
+        self.touch(job)
+        self._record(job)
+
+    def start(self, job):
+        job.state = JOB_RUNNING
+        job.started_at = time.time()
+        self.touch(job)
+        self._record(job)
+
+    def touch(self, job):
+        self.revision += 1
+        job.revision = self.revision
+
+    def finish(self, job):
+        self.touch(job)
+        self._record(job)
+        self._finished.append(job.job_id)
+
+        while len(self._finished) > self.keep_finished:
+            job_id = self._finished.popleft()
+            self._jobs.pop(job_id, None)
+            self.revision += 1
+            self._removed.append((self.revision, job_id))
+
+    def _record(self, job):
+        # Cancelled jobs stay queued or running in the journal, so they are
+        # resumed.
+        if self.journal is not None and not job.cancelled:
+            self.journal.record(job)
+
+    def get_changes(self, since=0):
+        """
+        Returns the jobs changed, and the ids of the jobs removed, after the
+        since revision. A full snapshot is returned when since is too old to
+        know which jobs have been removed in the meantime.
+        """
+        full = since <= 0 or since > self.revision or bool(
+            self._removed
+            and len(self._removed) == self._removed.maxlen
+            and self._removed[0][0] > since
+        )
+
+        return {
+            'revision': self.revision,
+            'full': full,
+            'jobs': [
+                job.get_status() for job in self._jobs.values()
+                if full or job.revision > since
+            ],
+            'removed': [] if full else [
+                job_id for revision, job_id in self._removed
+                if revision > since
+            ],
+        }
+
+
+class JobScheduler(object):
+    """
+    Runs extraction jobs with a bounded number of concurrent processes.
+
+    Besides the global limit, every storage device touched by a job (the disk
+    holding the archive and the one it is extracted to) has its own cap so
+    independent disks work in parallel while a single spindle is never
+    oversubscribed.
+
+    Queued jobs are started in priority order, falling back to submission
+    order, so the jobs of a single torrent stay together and the first torrent
+    to finish downloading is also the first one to be released. A job blocked
+    by a busy device does not hold back jobs for other devices.
+
+    A runner raising RetryJob sends the job back to the queue once the delay
+    it asks for has passed.
+    """
+
+    def __init__(self, runner, max_jobs=1, order=JOB_ORDER_FIFO,
+                 label_priority=None, max_jobs_per_device=0,
+                 device_limits=None):
+        self.runner = runner
+        self.max_jobs = max_jobs
+        self.order = order
+        self.label_priority = label_priority or []
+        self.max_jobs_per_device = max_jobs_per_device
+        self.device_limits = device_limits or {}
+
+        self._queue = []
+        self._running = set()
+        self._delayed = {}
+        self._device_jobs = Counter()
+        self._counter = itertools.count()
+        self._pumping = False
+
+    def configure(self, max_jobs, order, label_priority,
+                  max_jobs_per_device=0, device_limits=None):
+        """
+        Updates the scheduling limits. device_limits maps a device id to the
+        cap for that device, other devices use max_jobs_per_device. A cap of
+        0 leaves the device limited by max_jobs only.
+        """
+        self.max_jobs = max(1, int(max_jobs))
+        self.order = order
+        self.label_priority = label_priority
+        self.max_jobs_per_device = max(0, int(max_jobs_per_device))
+        self.device_limits = device_limits or {}
+        self._pump()
+
+    def push(self, job):
+        """
+        Queues a job and returns a Deferred firing with the runner result once
+        the job has been run.
+        """
+        self._enqueue(job)
+        return job.deferred
+
+    def _enqueue(self, job):
+        self._queue.append((self._priority(job), next(self._counter), job))
+        log.debug(
+            '[%s] Queued %s (%d queued, %d running)',
+            job.torrent_id,
+            job.source,
+            len(self._queue),
+            len(self._running),
+        )
+        self._pump()
+
+    def clear(self):
+        """Drops every job that has not been started yet."""
+        jobs = [entry[2] for entry in self._queue] + list(self._delayed)
+        for call in self._delayed.values():
+            call.cancel()
+        self._queue = []
+        self._delayed = {}
+        return jobs
+
+    @property
+    def queued(self):
+        return len(self._queue) + len(self._delayed)
+
+    @property
+    def running(self):
+        return len(self._running)
+
+    def _priority(self, job):
+        if self.order == JOB_ORDER_SMALLEST:
+            return job.size
+        if self.order == JOB_ORDER_LABEL:
+            try:
+                return self.label_priority.index(job.label)
+            except ValueError:
+                return len(self.label_priority)
+        return 0
+
+    def _device_limit(self, device):
+        return self.device_limits.get(device, self.max_jobs_per_device)
+
+    def _can_start(self, job):
+        for device in job.devices:
+            limit = self._device_limit(device)
+            if limit and self._device_jobs[device] >= limit:
+                return False
+        return True
+
+    def _pump(self):
+        # A runner failing or retrying synchronously ends its job, and pumps
+        # again, from within _start. The outer pump picks up where it left.
+        if self._pumping:
+            return
+
+        self._pumping = True
+        try:
+            while len(self._running) < self.max_jobs:
+                entry = self._next_entry()
+                if entry is None:
+                    break
+                self._queue.remove(entry)
+                self._start(entry[2])
+        finally:
+            self._pumping = False
+
+    def _next_entry(self):
+        for entry in sorted(self._queue):
+            if self._can_start(entry[2]):
+                return entry
+        return None
+
+    def _start(self, job):
+        job.state = JOB_RUNNING
+        self._running.add(job)
+        self._device_jobs.update(job.devices)
+
+        d = maybeDeferred(self.runner, job)
+        d.addBoth(self._on_job_done, job)
+
+    def _on_job_done(self, result, job):
+        self._running.discard(job)
+        self._device_jobs.subtract(job.devices)
+
+        if isinstance(result, Failure) and result.check(RetryJob) and \
+                job.cancelled:
+            result = 1, CANCELLED_ERROR
+        if isinstance(result, Failure) and result.check(RetryJob):
+            log.info(
+                '[%s] Retrying %s in %d seconds: %s',
+                job.torrent_id,
+                job.source,
+                result.value.delay,
+                result.getErrorMessage(),
+            )
+            job.state = JOB_QUEUED
+            self._delayed[job] = reactor.callLater(
+                result.value.delay, self._retry, job
+            )
+        elif isinstance(result, Failure):
+            job.deferred.errback(result)
+        else:
+            job.deferred.callback(result)
+
+        self._pump()
+
+    def _retry(self, job):
+        del self._delayed[job]
+        self._enqueue(job)
+
 
 class Core(CorePluginBase):
     def __init__(self, plugin_name):
@@ -164,6 +764,27 @@ class Core(CorePluginBase):
 
         self.config = DEFAULT_PREFS
         self.supported_labels = []
+        self.scheduler = JobScheduler(self._run_job)
+        self.jobs = JobRegistry()
+        self.engine = engine.ExtractEngine()
+        self.lister = ArchiveLister()
+        self.pipelines = {}
+        self.priority_wrapper = []
+        self.member_filter = MemberFilter()
+        self.notifier = PVRNotifier()
+        self.metrics = ExtractMetrics()
+        self.metrics_exporter = MetricsExporter(self._render_metrics)
+        self._reserved_space = Counter()
+        self.journal = None
+        self._jobs_resumed = False
+        self._backlog_scan = None
+        self._finished_events = OrderedDict()
+        self._finished_call = None
+        self._finished_tasks = set()
+        self._active_torrents = set()
+        # Fires once the jobs cancelled by the last disable have ended.
+        self._stopped = succeed(None)
+        self._watchdog = task.LoopingCall(self._check_timeouts)
 
     def enable(self):
         self.config = deluge.configmanager.ConfigManager(
@@ -175,23 +796,326 @@ class Core(CorePluginBase):
                     'core.conf'
                 )['download_location']
 
-        self.supported_labels = list(filter(None, map(
-            lambda i: i.strip(),
-            self.config[CONFIG_SUPPORTED_LABELS].split(',')
-        )))
+        self._apply_config()
+        # Extractors cancelled by the last disable may still be exiting, they
+        # must not lose their staging directory nor run alongside their
+        # resumed jobs.
+        self._stopped.addCallback(lambda _: self._clean_staging_path())
+
+        self.journal = Journal(
+            deluge.configmanager.get_config_dir(JOURNAL_FILE)
+        )
+        self.journal.open()
+        self.jobs.journal = self.journal
+        self._jobs_resumed = False
+        self._watchdog.start(WATCHDOG_INTERVAL, now=False)
 
         component.get('EventManager').register_event_handler(
-            'TorrentFinishedEvent', self._on_torrent_finished
+            'TorrentFinishedEvent', self._on_torrent_finished_event
+        )
+        component.get('EventManager').register_event_handler(
+            'TorrentFileCompletedEvent', self._on_torrent_file_completed
+        )
+        component.get('EventManager').register_event_handler(
+            'TorrentRemovedEvent', self._on_torrent_removed
         )
 
+        # Plugins are enabled before the torrents are loaded on startup.
+        if component.get('TorrentManager').torrents:
+            self._stopped.addCallback(lambda _: self._resume_jobs())
+        else:
+            component.get('EventManager').register_event_handler(
+                'SessionStartedEvent', self._resume_jobs
+            )
+
     def disable(self):
         component.get('EventManager').deregister_event_handler(
-            'TorrentFinishedEvent', self._on_torrent_finished
+            'TorrentFinishedEvent', self._on_torrent_finished_event
+        )
+        component.get('EventManager').deregister_event_handler(
+            'TorrentFileCompletedEvent', self._on_torrent_file_completed
+        )
+        component.get('EventManager').deregister_event_handler(
+            'TorrentRemovedEvent', self._on_torrent_removed
+        )
+        component.get('EventManager').deregister_event_handler(
+            'SessionStartedEvent', self._resume_jobs
         )
 
+        if self._backlog_scan is not None:
+            self._backlog_scan.stop()
+
+        if self._finished_call is not None:
+            self._finished_call.cancel()
+            self._finished_call = None
+        self._finished_events.clear()
+        for finished_task in list(self._finished_tasks):
+            finished_task.stop()
+
+        if self._watchdog.running:
+            self._watchdog.stop()
+
+        for key, pipeline in list(self.pipelines.items()):
+            if pipeline is None or pipeline.protocol is None:
+                # Being prepared or still queued, dropped with the queue.
+                del self.pipelines[key]
+                if pipeline is not None:
+                    pipeline.cleanup()
+
+        stopping = [
+            self._cancel_job(job) for job in self.jobs
+            if job.state == JOB_RUNNING
+        ]
+        self._stopped = gatherResults(stopping)
+        self.engine.stop()
+
+        dropped = self.scheduler.clear()
+        if dropped:
+            log.warning(
+                'Plugin disabled, %d queued extraction(s) will resume when '
+                'it is enabled again',
+                len(dropped)
+            )
+        self._active_torrents.clear()
+        self.notifier.stop()
+        self.metrics_exporter.stop()
+
+        self.jobs.journal = None
+        self.journal.close()
+        self.journal = None
+
     def update(self):
         pass
 
+    def _apply_config(self):
+        self.supported_labels = split_list(
+            self.config[CONFIG_SUPPORTED_LABELS]
+        )
+        self.scheduler.configure(
+            self.config[CONFIG_MAX_JOBS],
+            self.config[CONFIG_JOB_ORDER],
+            split_list(self.config[CONFIG_LABEL_PRIORITY]),
+            self.config[CONFIG_MAX_JOBS_PER_DEVICE],
+            self._resolve_device_limits(),
+        )
+
+        self.engine.threads = max(1, int(self.config[CONFIG_ENGINE_THREADS]))
+
+        self.member_filter = MemberFilter(
+            split_list(self.config[CONFIG_INCLUDE_MEMBERS]),
+            split_list(self.config[CONFIG_EXCLUDE_MEMBERS]),
+        )
+        self.notifier.configure(self.config[CONFIG_PVR_SERVERS])
+        self.metrics_exporter.configure(
+            self.config[CONFIG_METRICS_FILE],
+            int(self.config[CONFIG_METRICS_PORT]),
+        )
+
+        self.priority_wrapper = priority_wrapper(
+            int(self.config[CONFIG_NICE_LEVEL]),
+            self.config[CONFIG_IONICE_CLASS],
+            int(self.config[CONFIG_IONICE_LEVEL]),
+            self._setup_cgroup(),
+        )
+
+    def _setup_cgroup(self):
+        """
+        Applies the cpu.max and io.max limits to the configured cgroup and
+        returns its path, or None when there is no usable cgroup.
+        """
+        cgroup_path = self.config[CONFIG_CGROUP_PATH]
+        if not cgroup_path or windows_check():
+            return None
+
+        try:
+            fileops.makedirs(cgroup_path)
+            for name, key in (
+                ('cpu.max', CONFIG_CGROUP_CPU_MAX),
+                ('io.max', CONFIG_CGROUP_IO_MAX),
+            ):
+                if self.config[key]:
+                    with open(os.path.join(cgroup_path, name), 'w') as f:
+                        f.write(self.config[key] + '\n')
+        except (IOError, OSError) as ex:
+            log.warning('Error setting up cgroup %s: %s', cgroup_path, ex)
+
+        if not os.access(os.path.join(cgroup_path, 'cgroup.procs'), os.W_OK):
+            log.warning(
+                'Cannot move extractors to cgroup %s, is it a writable '
+                'cgroup v2 directory?',
+                cgroup_path,
+            )
+            return None
+        return cgroup_path
+
+    def _clean_staging_path(self):
+        """Removes the staging directories left over by a daemon crash."""
+        staging_path = self.config[CONFIG_STAGING_PATH]
+        if not staging_path:
+            return
+
+        in_use = set(job.work_dir for job in self.jobs if job.work_dir)
+        deferToThread(self._remove_stale_staging, staging_path, in_use)
+
+    @staticmethod
+    def _remove_stale_staging(staging_path, in_use):
+        """
+        Removes the staging directories in staging_path but those in_use.
+        Runs on a thread.
+        """
+        if not os.path.isdir(staging_path):
+            return
+
+        for name in os.listdir(staging_path):
+            path = os.path.join(staging_path, name)
+            if name.startswith(STAGING_PREFIX) and path not in in_use:
+                log.info('Removing stale staging directory %s', name)
+                fileops.remove_tree(path)
+
+    def _resolve_device_limits(self):
+        """Maps the configured paths of device_limits to their device ids."""
+        device_limits = {}
+        for path, limit in self.config[CONFIG_DEVICE_LIMITS].items():
+            device = get_device(path)
+            if device is None:
+                log.warning('Ignoring device limit for unknown path %s', path)
+                continue
+            device_limits[device] = int(limit)
+        return device_limits
+
+    def _resume_jobs(self):
+        """
+        Queues again the jobs the journal recorded as queued or running, left
+        over when the daemon stopped in the middle of extracting.
+        """
+        if self._jobs_resumed or self.journal is None:
+            return
+        self._jobs_resumed = True
+
+        entries = self.journal.get_entries([JOB_QUEUED, JOB_RUNNING])
+        paths = set([self.config[CONFIG_STAGING_PATH]])
+        for entry in entries:
+            paths.update((entry.source, entry.target))
+
+        d = deferToThread(get_devices, paths)
+        d.addCallback(self._queue_resumed_jobs, entries)
+        d.addErrback(
+            lambda failure: log.error(
+                'Could not resume the extractions: %s',
+                failure.getErrorMessage(),
+            )
+        )
+        return d
+
+    def _queue_resumed_jobs(self, devices, entries):
+        if self.journal is None:
+            return
+
+        torrents = component.get('TorrentManager').torrents
+        torrent_counts = {}
+
+        for entry in entries:
+            torrent = torrents.get(entry.torrent_id)
+            if torrent is None:
+                self.journal.forget(entry.torrent_id)
+                continue
+
+            if torrent.get_status(['progress'])['progress'] < 100:
+                # A pipelined extraction, done again when the torrent finishes.
+                self.journal.forget(entry.torrent_id, entry.source)
+                continue
+
+            if entry.torrent_id not in torrent_counts:
+                torrent_counts[entry.torrent_id] = dict({
+                    KEY_TOTAL: 0,
+                    KEY_COMPLETED: 0,
+                    KEY_TARGET: entry.target,
+                    KEY_LABEL: entry.label,
+                })
+                self._active_torrents.add(entry.torrent_id)
+                if self._is_pvr_support_enabled():
+                    torrent.is_finished = False
+
+            log.info(
+                '[%s] Resuming %s extraction of %s',
+                entry.torrent_id,
+                entry.state,
+                entry.source,
+            )
+            self._extract_file(
+                torrent_counts[entry.torrent_id],
+                torrent,
+                entry.command,
+                entry.source,
+                entry.target,
+                entry.label,
+                entry.size,
+                entry.name,
+                devices=devices,
+            )
+
+        if self.journal.created:
+            # Torrents finished before the journal existed were handled by
+            # earlier versions, or by hand, the backlog scan must not extract
+            # them again.
+            self._start_backlog_scan(seed=True)
+        elif self.config[CONFIG_BACKLOG_SCAN]:
+            self._start_backlog_scan()
+
+    def _start_backlog_scan(self, seed=False):
+        """
+        Extracts the finished torrents the journal knows nothing about, which
+        finished while the plugin was disabled. Torrents are checked in small
+        batches so the daemon stays responsive with thousands of torrents.
+        With seed, they are marked in the journal instead of extracted.
+        """
+        self._backlog_scan = task.cooperate(self._scan_backlog(seed))
+        self._backlog_scan.whenDone().addBoth(self._on_backlog_scan_done)
+
+    def _scan_backlog(self, seed=False):
+        finished = []
+        known_torrents = self.journal.get_known_torrents()
+        torrent_ids = list(component.get('TorrentManager').torrents)
+        log.info('Scanning %d torrents for extraction', len(torrent_ids))
+
+        for index, torrent_id in enumerate(torrent_ids):
+            if index and not index % SCAN_BATCH_SIZE:
+                yield
+
+            if torrent_id in known_torrents:
+                continue
+
+            torrent = component.get('TorrentManager').torrents.get(torrent_id)
+            if torrent is None:
+                continue
+
+            if torrent.get_status(['progress'])['progress'] < 100:
+                continue
+
+            if seed:
+                finished.append(torrent_id)
+                continue
+
+            # The torrent may have finished since the scan started.
+            if self.journal is not None and \
+                    not self.journal.is_known(torrent_id):
+                log.info('[%s] Found unextracted finished torrent', torrent_id)
+                self._on_torrent_finished(torrent_id)
+
+        if seed and self.journal is not None:
+            log.info('Marking %d finished torrents as extracted in the new '
+                     'journal', len(finished))
+            self.journal.mark_torrents(finished)
+
+    def _on_backlog_scan_done(self, result):
+        self._backlog_scan = None
+        if isinstance(result, Failure) and not result.check(task.TaskStopped):
+            log.error('Backlog scan failed: %s', result.getErrorMessage())
+
+    def _on_torrent_removed(self, torrent_id):
+        if self.journal is not None:
+            self.journal.forget(torrent_id)
+
     def _is_pvr_support_enabled(self):
         return bool(self.config[CONFIG_PVR_SUPPORT])
 
@@ -199,6 +1123,63 @@ class Core(CorePluginBase):
         supported_labels = self.config[CONFIG_SUPPORTED_LABELS]
         return not supported_labels or label in supported_labels
 
+    def _on_torrent_finished_event(self, torrent_id):
+        """
+        Collects the TorrentFinishedEvents of a short window and hands them
+        on once per torrent, however many times each one fired.
+        """
+        if torrent_id in self._finished_events:
+            log.debug('[%s] Ignoring repeated finished event', torrent_id)
+            return
+
+        # Deluge sets is_finished before emitting the event, it is cleared
+        # right away so the PVR does not import during the window.
+        if self._is_pvr_support_enabled():
+            torrent = component.get('TorrentManager').torrents[torrent_id]
+            label = component.get('CorePluginManager').get_status(
+                torrent_id, ['label']
+            )['label']
+            if self._is_label_supported(label):
+                torrent.is_finished = False
+
+        self._finished_events[torrent_id] = None
+        if self._finished_call is None:
+            self._finished_call = reactor.callLater(
+                FINISHED_EVENT_WINDOW, self._flush_finished_events
+            )
+
+    def _flush_finished_events(self):
+        self._finished_call = None
+        torrent_ids = list(self._finished_events)
+        self._finished_events.clear()
+
+        finished_task = task.cooperate(
+            self._handle_finished_events(torrent_ids)
+        )
+        self._finished_tasks.add(finished_task)
+        finished_task.whenDone().addBoth(
+            self._on_finished_events_done, finished_task
+        )
+
+    def _handle_finished_events(self, torrent_ids):
+        log.debug('Handling %d finished torrents', len(torrent_ids))
+
+        for index, torrent_id in enumerate(torrent_ids):
+            if index and not index % SCAN_BATCH_SIZE:
+                yield
+
+            # The torrent may have been removed during the window.
+            if torrent_id in component.get('TorrentManager').torrents:
+                self._on_torrent_finished(torrent_id)
+
+    def _on_finished_events_done(self, result, finished_task):
+        self._finished_tasks.discard(finished_task)
+        if isinstance(result, Failure) and not result.check(task.TaskStopped):
+            log.error(
+                'Handling finished torrents failed: %s',
+                result.getErrorMessage(),
+            )
+
     def _on_torrent_finished(self, torrent_id):
         """
         This is called when a torrent finishes and checks if any files need
@@ -210,6 +1191,16 @@ class Core(CorePluginBase):
             torrent_id, ['label']
         )['label']
 
+        if torrent_id in self._active_torrents:
+            # A recheck of a torrent being extracted, extracting it again
+            # would write into the same folder concurrently.
+            log.info(
+                '[%s] Extraction already in progress, ignoring: %s',
+                torrent_id,
+                torrent_name
+            )
+            return
+
         if not self._is_label_supported(torrent_label):
             log.info(
                 '[%s] Label %s is not in supported list. Skip extraction: %s',
@@ -227,50 +1218,119 @@ class Core(CorePluginBase):
             )
             torrent.is_finished = False
 
-        counts = self._extract_torrent(torrent)
+        torrent_location = torrent.get_status(['download_location'])[
+            'download_location'
+        ]
+
+        self._active_torrents.add(torrent_id)
+        # Planning goes through every file of the torrent, and the destination
+        # may be on a slow or stalled mount, neither must block the reactor.
+        d = deferToThread(
+            self._prepare_torrent, torrent_name, torrent_location,
+            torrent.get_files(),
+        )
+        d.addCallback(self._on_torrent_prepared, torrent, torrent_label)
+        d.addErrback(self._on_torrent_prepare_failed, torrent_id, torrent_name)
+        return d
+
+    def _prepare_torrent(self, torrent_name, torrent_location, files):
+        """
+        Plans the extraction of the files of a torrent then, when it has
+        archives, creates its destination and looks up the devices of its
+        archives and destination. Runs on a thread.
+        """
+        plan = planner.plan_torrent(files, EXTENSION_INDEX)
+        if not plan.archives:
+            return plan, None, {}
+
+        extract_path = self._find_destination_path(
+            torrent_name, torrent_location
+        )
+        devices = get_devices(
+            [
+                os.path.join(torrent_location, os.path.normpath(archive.path))
+                for archive in plan.archives
+            ] + [extract_path, self.config[CONFIG_STAGING_PATH]]
+        )
+        return plan, extract_path, devices
+
+    def _on_torrent_prepared(self, prepared, torrent, label):
+        # The plugin may have been disabled while the torrent was prepared,
+        # nothing records the torrent then so it is handed back as is.
+        if self.journal is None:
+            if self._is_pvr_support_enabled():
+                torrent.is_finished = True
+            return
+
+        plan, extract_path, devices = prepared
+        torrent_id = torrent.torrent_id
+        counts = self._extract_torrent(
+            torrent, label, plan, extract_path, devices
+        )
+
+        if counts[KEY_TOTAL] == 0:
+            self._active_torrents.discard(torrent_id)
+            if self.journal is not None:
+                self.journal.mark_torrent(torrent_id)
 
         if self._is_pvr_support_enabled() and counts[KEY_TOTAL] == 0:
             log.info(
                 '[%s} Nothing to extract. Set is_finished to true: %s',
                 torrent_id,
-                torrent_name
+                torrent.get_status(['name'])['name']
             )
             torrent.is_finished = True
 
-    def _extract_torrent(self, torrent):
+        if counts[KEY_TOTAL] == 0 and counts.get(KEY_TARGET):
+            # Every archive was extracted while downloading.
+            self.notifier.notify(torrent_id, counts[KEY_TARGET], label)
+
+    def _on_torrent_prepare_failed(self, failure, torrent_id, torrent_name):
+        self._active_torrents.discard(torrent_id)
+        log.error(
+            '[%s] Could not prepare the extraction of %s: %s',
+            torrent_id,
+            torrent_name,
+            failure.getErrorMessage(),
+        )
+
+    def _extract_torrent(self, torrent, label, plan, extract_path, devices):
         torrent_status = torrent.get_status(['download_location', 'name'])
         torrent_name = torrent_status['name']
         torrent_location = torrent_status['download_location']
 
         # keep track of total extraction jobs... store in list so it is mutable
         # index 0 = total, index 1 = completed
-        counts = dict({KEY_TOTAL: 0, KEY_COMPLETED: 0})
-        files = torrent.get_files()
+        counts = dict({KEY_TOTAL: 0, KEY_COMPLETED: 0, KEY_LABEL: label})
 
-        for file in files:
-            file_path = file['path']
+        log.info(
+            '[%s] Found %d archives, %d other files and %d unsupported '
+            'archives',
+            torrent.torrent_id,
+            len(plan.archives),
+            len(plan.other_files),
+            plan.unsupported,
+        )
 
-            command = self._find_extract_command(file_path)
-            if command is None:
-                log.info(
-                    '[%s] No extraction command found for file `%s`',
-                    torrent.torrent_id,
-                    file_path,
-                )
+        if extract_path:
+            # Also set for archives extracted while downloading, so their
+            # torrent is notified.
+            counts[KEY_TARGET] = extract_path
+
+        for archive in plan.archives:
+            file_path = archive.path
+
+            if self._adopt_pipeline(torrent, counts, file_path):
                 continue
 
             file_path = os.path.join(
                 torrent_location,
                 os.path.normpath(file_path)
             )
-            extract_path = self._find_destination_path(
-                torrent_name,
-                torrent_location,
-            )
 
             if extract_path is None:
                 log.info(
-                    '[%s] No destination path found for %s at torrent_location',
+                    '[%s] No destination path found for %s at %s',
                     torrent.torrent_id,
                     torrent_name,
                     torrent_location,
@@ -280,14 +1340,84 @@ class Core(CorePluginBase):
             self._extract_file(
                 counts,
                 torrent,
-                command,
+                archive.command,
                 file_path,
-                extract_path
+                extract_path,
+                label,
+                archive.size,
+                torrent_name,
+                devices=devices,
+                volumes=[
+                    (volume['index'], volume['path'])
+                    for volume in archive.volumes
+                ],
             )
 
-        return counts
+        if counts[KEY_TOTAL] and plan.other_files and extract_path and \
+                self.config[CONFIG_LINK_FILES] and \
+                not self.config[CONFIG_IN_PLACE_EXTRACT]:
+            self._link_other_files(
+                counts, torrent, torrent_location, plan.other_files,
+                extract_path,
+            )
+
+        return counts
+
+    def _link_other_files(self, counts, torrent, torrent_location, files,
+                          target):
+        """
+        Puts the files of a torrent that are not archives next to its
+        extracted files, so the destination holds the whole release. The
+        torrent waits on them like on an extraction.
+        """
+        links = []
+        for file_path in files:
+            parts = os.path.normpath(file_path).split(os.sep)
+            # The files of a multi-file torrent are in its top folder.
+            dest_parts = parts[1:] if len(parts) > 1 else parts
+            links.append((
+                os.path.join(torrent_location, *parts),
+                os.path.join(target, *dest_parts),
+            ))
 
-    def _extract_file(self, counts, torrent, command, source, target):
+        counts[KEY_TOTAL] += 1
+        pvr_support = self._is_pvr_support_enabled()
+        d = deferToThread(self._link_files, torrent.torrent_id, links)
+        d.addErrback(
+            lambda failure: log.error(
+                '[%s] Could not link files into %s: %s',
+                torrent.torrent_id,
+                target,
+                failure.getErrorMessage(),
+            )
+        )
+        d.addCallback(
+            lambda _: self._on_counted(counts, torrent, pvr_support, target)
+        )
+
+    @staticmethod
+    def _link_files(torrent_id, links):
+        methods = Counter()
+        for source, target in links:
+            try:
+                methods[fileops.link_file(source, target)] += 1
+            except (IOError, OSError) as ex:
+                log.error('[%s] Could not link %s to %s: %s', torrent_id,
+                          source, target, ex)
+        del methods[None]
+        if not methods:
+            return
+        log.info(
+            '[%s] Linked %d files: %s',
+            torrent_id,
+            sum(methods.values()),
+            ', '.join('%d by %s' % (count, method)
+                      for method, count in sorted(methods.items())),
+        )
+
+    def _extract_file(self, counts, torrent, command, source, target,
+                      label='', size=0, name='', depth=0, devices=None,
+                      volumes=None, max_bytes=None):
         counts[KEY_TOTAL] += 1
         log.info(
             '[%s] Extraction count total %d, complete %d',
@@ -295,31 +1425,846 @@ class Core(CorePluginBase):
             counts[KEY_TOTAL],
             counts[KEY_COMPLETED],
         )
-        log.info(
-            '[%s] Extracting %s with `%s %s` to %s',
-            torrent.torrent_id,
+
+        job = ExtractJob(
+            counts,
+            torrent,
+            command,
             source,
-            command[0],
-            command[1],
             target,
+            label,
+            size,
+            name,
+            self.config[CONFIG_STAGING_PATH],
+            depth,
+            devices,
+            volumes,
         )
+        job.max_bytes = max_bytes
+        self.jobs.add(job)
 
-        d = getProcessOutputAndValue(
-            command[0],
-            command[1].split() + [str(source)],
-            os.environ,
-            str(target)
-        )
+        d = self.scheduler.push(job)
+        d.addErrback(self._on_job_error, job)
         d.addCallback(
             self._on_extract,
-            counts,
+            job,
             self.config[CONFIG_PVR_SUPPORT],
-            torrent,
-            source,
+        )
+        return job
+
+    @staticmethod
+    def _on_job_error(failure, job):
+        """Turns an unexpected error into a failed job."""
+        log.error(
+            '[%s] Unexpected error extracting %s: %s',
+            job.torrent_id,
+            job.source,
+            failure.getTraceback(),
+        )
+        return 1, failure.getErrorMessage()
+
+    def _run_job(self, job):
+        self.jobs.start(job)
+        if job.pipeline is not None:
+            return self._run_pipeline(job)
+
+        d = maybeDeferred(self._check_manifest, job)
+        d.addCallback(self._extract_nested, job)
+        return d
+
+    def _check_manifest(self, job):
+        manifest = None
+        if self.journal is not None:
+            manifest = self.journal.get_manifest(job.source, job.target)
+        if manifest is None:
+            return self._check_duplicate(job)
+
+        d = deferToThread(is_extracted, manifest)
+        d.addCallback(self._on_manifest_checked, job)
+        return d
+
+    def _on_manifest_checked(self, extracted, job):
+        if not extracted:
+            return self._check_duplicate(job)
+
+        log.info(
+            '[%s] Archive unchanged and already extracted to %s: %s',
+            job.torrent_id,
+            job.target,
+            job.source,
+        )
+        job.skipped = True
+        return 0, ''
+
+    def _check_duplicate(self, job):
+        """
+        Looks for an identical archive extracted before, by another torrent
+        of a cross-seeded release for instance, and links the files it was
+        extracted to instead of extracting the archive again.
+        """
+        if self.journal is None or not self.config[CONFIG_DEDUPLICATE]:
+            return self._check_archive(job)
+
+        d = deferToThread(content_key, job.source)
+        d.addCallbacks(
+            self._on_content_key,
+            self._on_duplicate_check_failed,
+            callbackArgs=(job,),
+            errbackArgs=(job,),
+        )
+        return d
+
+    def _on_content_key(self, key, job):
+        job.content_key = key
+        if self.journal is None:
+            return self._check_archive(job)
+
+        manifests = self.journal.find_content(key, job.source, job.target)
+        if not manifests:
+            return self._check_archive(job)
+
+        d = deferToThread(link_outputs, manifests, job.target)
+        d.addCallbacks(
+            self._on_duplicate_linked,
+            self._on_duplicate_check_failed,
+            callbackArgs=(job,),
+            errbackArgs=(job,),
+        )
+        return d
+
+    def _on_duplicate_linked(self, manifest, job):
+        if manifest is None:
+            return self._check_archive(job)
+
+        log.info(
+            '[%s] Linked the files of identical archive %s into %s: %s',
+            job.torrent_id,
+            manifest.source,
+            job.target,
+            job.source,
+        )
+        return 0, ''
+
+    def _on_duplicate_check_failed(self, failure, job):
+        log.warning(
+            '[%s] Could not look for an identical archive, extracting %s: %s',
+            job.torrent_id,
+            job.source,
+            failure.getErrorMessage(),
+        )
+        return self._check_archive(job)
+
+    def _extract_nested(self, result, job):
+        """
+        Queues the archives a successful job extracted as jobs of their own,
+        up to nested_depth levels deep. Their torrent waits on them too.
+        """
+        if result[0] or job.counts is None or \
+                job.depth >= self.config[CONFIG_NESTED_DEPTH]:
+            return result
+
+        d = self.lister.list(job.command, job.source)
+        d.addCallback(self.member_filter.filter_entries)
+        d.addCallback(self._on_outputs_listed, job)
+        d.addCallback(self._list_nested, job)
+        d.addErrback(
+            lambda failure: log.warning(
+                '[%s] Could not look for archives in %s: %s',
+                job.torrent_id,
+                job.target,
+                failure.getErrorMessage(),
+            )
+        )
+        return d.addCallback(lambda _: result)
+
+    @staticmethod
+    def _on_outputs_listed(entries, job):
+        if entries is None:
+            return deferToThread(
+                fileops.find_new_files, job.target, job.started_at
+            )
+        return [
+            os.path.join(job.target, os.path.normpath(entry.name))
+            for entry in entries
+        ]
+
+    def _list_nested(self, paths, job):
+        archives = []
+        for path in paths:
+            command = self._find_extract_command(path)
+            if command:
+                archives.append((path, command))
+
+        d = gatherResults([
+            self.lister.list(command, path).addCallback(
+                self.member_filter.filter_entries
+            )
+            for path, command in archives
+        ])
+        d.addCallback(
+            lambda listings: deferToThread(
+                self._measure_nested, listings, archives, job.staging
+            )
+        )
+        d.addCallback(self._queue_nested, archives, job)
+        return d
+
+    @staticmethod
+    def _measure_nested(listings, archives, staging):
+        """
+        Returns the sizes of nested archives, from their listing when there
+        is one, and the devices of their paths. Runs on a thread.
+        """
+        sizes = []
+        for (path, command), entries in zip(archives, listings):
+            if entries is None:
+                sizes.append(os.path.getsize(path))
+            else:
+                sizes.append(sum(entry.size for entry in entries))
+
+        paths = [path for path, command in archives]
+        devices = get_devices(
+            paths + [os.path.dirname(path) for path in paths] + [staging]
+        )
+        return sizes, devices
+
+    def _queue_nested(self, measured, archives, job):
+        budget = self.config[CONFIG_NESTED_MAX_BYTES]
+        counts = job.counts
+        sizes, devices = measured
+
+        for (path, command), size in zip(archives, sizes):
+            if counts.get(KEY_NESTED_BYTES, 0) + size > budget:
+                log.warning(
+                    '[%s] Not extracting nested archive %s, the %s budget '
+                    'for nested archives would be exceeded',
+                    job.torrent_id,
+                    path,
+                    fsize(budget),
+                )
+                continue
+
+            remaining = budget - counts.get(KEY_NESTED_BYTES, 0)
+            counts[KEY_NESTED_BYTES] = counts.get(KEY_NESTED_BYTES, 0) + size
+            log.info('[%s] Found nested archive %s', job.torrent_id, path)
+            # Sizes of unlisted archives are only a guess, extractions
+            # writing more than the budget left are stopped.
+            self._extract_file(
+                counts,
+                job.torrent,
+                command,
+                path,
+                os.path.dirname(path),
+                job.label,
+                size,
+                job.name,
+                job.depth + 1,
+                devices,
+                max_bytes=remaining,
+            )
+
+    def _check_archive(self, job):
+        """
+        Checks that every volume of a rar set is downloaded and has valid
+        headers, failing broken sets before unrar reads through them.
+        """
+        if not rarcheck.is_rar(job.source):
+            return self._check_free_space(job)
+
+        error = self._find_incomplete_volume(job)
+        if error:
+            return self._on_archive_broken(error, job)
+
+        d = deferToThread(rarcheck.check_set, job.source)
+        d.addCallbacks(
+            lambda volumes: self._check_free_space(job),
+            self._on_set_check_failed,
+            errbackArgs=(job,),
+        )
+        return d
+
+    @staticmethod
+    def _find_incomplete_volume(job):
+        """Returns an error for a volume of the set not fully downloaded."""
+        if job.depth:
+            # Nested archives are extracted files, not files of the torrent.
+            return None
+
+        volumes = job.volumes
+        if volumes is None:
+            location = job.torrent.get_status(['download_location'])[
+                'download_location'
+            ]
+            volumes = [
+                (file['index'], file['path'])
+                for file in job.torrent.get_files()
+                if rarcheck.in_set(
+                    job.source,
+                    os.path.join(location, os.path.normpath(file['path'])),
+                )
+            ]
+
+        file_progress = job.torrent.get_file_progress()
+        for index, path in volumes:
+            if file_progress[index] < 1:
+                return '%s is not downloaded, is it skipped?' % (
+                    os.path.basename(path)
+                )
+        return None
+
+    def _on_set_check_failed(self, failure, job):
+        failure.trap(rarcheck.BrokenSetError)
+        return self._on_archive_broken(failure.getErrorMessage(), job)
+
+    @staticmethod
+    def _on_archive_broken(error, job):
+        log.error('[%s] Broken archive %s: %s', job.torrent_id, job.source,
+                  error)
+        return 1, error
+
+    def _check_free_space(self, job):
+        """
+        Lists the archive of a job and compares its uncompressed size with
+        the free space left where it is extracted, before running the job.
+        """
+        if self.config[CONFIG_FREE_SPACE] == FREE_SPACE_OFF:
+            return self._spawn_job(job)
+
+        d = self.lister.list(job.command, job.source)
+        d.addErrback(lambda failure: None)
+        d.addCallback(self.member_filter.filter_entries)
+        d.addCallback(self._on_free_space_listed, job)
+        return d
+
+    def _on_free_space_listed(self, entries, job):
+        if entries is None:
+            # Not listable, compressed tarballs for instance.
+            return self._spawn_job(job)
+
+        return self._reserve_space(
+            job, sum(entry.size for entry in entries), self._spawn_job
         )
 
+    def _reserve_space(self, job, required, spawn):
+        """
+        Runs spawn for a job once required bytes are set aside where it is
+        extracted, or fails or defers the job when there is not enough room.
+        """
+        d = deferToThread(self._get_free_space, [job.staging, job.target])
+        d.addCallback(self._on_free_space, job, required, spawn)
+        return d
+
     @staticmethod
-    def _on_extract(result, counts, pvr_support, torrent, source):
+    def _get_free_space(paths):
+        """
+        Returns the path, device and free space of each device holding one of
+        paths. Runs on a thread.
+        """
+        free_space = []
+        devices = set()
+        for path in paths:
+            device = get_device(path) if path else None
+            if device is None or device in devices:
+                continue
+            devices.add(device)
+            free_space.append((path, device, fileops.free_space(path)))
+        return free_space
+
+    def _on_free_space(self, free_space, job, required, spawn):
+        # Reserved on the reactor, so concurrent jobs see each other's
+        # reservations.
+        reservations = {}
+        for path, device, free in free_space:
+            available = free - self._reserved_space[device]
+            if available < required:
+                error = 'Not enough free space in %s, %s needed, %s ' \
+                        'available' % (path, fsize(required),
+                                       fsize(max(0, available)))
+                if self.config[CONFIG_FREE_SPACE] == FREE_SPACE_DEFER:
+                    job.error = error
+                    self.jobs.touch(job)
+                    raise RetryJob(error, FREE_SPACE_RETRY_DELAY)
+
+                log.error('[%s] %s: %s', job.torrent_id, error, job.source)
+                return 1, error
+            reservations[device] = required
+
+        job.error = ''
+        self._reserved_space.update(reservations)
+        d = maybeDeferred(spawn, job)
+        d.addBoth(self._release_space, reservations)
+        return d
+
+    def _release_space(self, result, reservations):
+        self._reserved_space.subtract(reservations)
+        return result
+
+    def _spawn_job(self, job):
+        if job.staging:
+            d = deferToThread(self._make_work_dir, job)
+        else:
+            d = succeed(None)
+        d.addCallback(self._start_extraction, job)
+        return d
+
+    def _start_extraction(self, error, job):
+        if error:
+            return 1, error
+        if job.cancelled:
+            return 1, CANCELLED_ERROR
+
+        job.timed_out = None
+        job.stalled = False
+        if self._use_engine(job):
+            d = self._run_engine_job(job)
+        else:
+            d = self._run_extractor(job)
+        d.addCallback(self._on_staged, job)
+        d.addCallback(self._check_retry, job)
+        return d
+
+    def _check_retry(self, result, job):
+        """
+        Sends a job failing for a transient reason, a stall or an I/O error,
+        back to the queue with an exponential backoff, up to max_retries
+        times.
+        """
+        exit_code, output = result
+        if job.timed_out:
+            output = '\n'.join(filter(None, (job.timed_out, output)))
+        if not exit_code:
+            return result
+
+        tool = tool_name(job.command)
+        if job.timed_out:
+            transient = job.stalled
+        else:
+            transient = exit_code > 128 or \
+                exit_code in TRANSIENT_EXIT_CODES.get(tool, ())
+        if not transient or job.attempts >= self.config[CONFIG_MAX_RETRIES]:
+            return exit_code, output
+
+        job.attempts += 1
+        job.error = output
+        self.jobs.touch(job)
+        raise RetryJob(
+            'attempt %d failed with exit code %d' % (job.attempts, exit_code),
+            RETRY_DELAY * 2 ** (job.attempts - 1),
+        )
+
+    def _run_extractor(self, job):
+        log.info(
+            '[%s] Extracting %s with `%s %s` to %s',
+            job.torrent_id,
+            job.source,
+            job.command[0],
+            job.command[1],
+            job.extract_path,
+        )
+
+        def on_progress(progress):
+            job.progress = progress
+            self._update_job_bytes(job)
+            self.jobs.touch(job)
+
+        before, after = self.member_filter.arguments(job.command)
+        job.protocol = spawn_extractor(
+            job.command[0],
+            shlex.split(job.command[1]) + before + [str(job.source)] + after,
+            str(job.extract_path),
+            os.environ,
+            on_progress=on_progress,
+            wrapper=self.priority_wrapper,
+        )
+        return job.protocol.deferred.addCallback(
+            self.member_filter.check_exit, job.command
+        )
+
+    def _use_engine(self, job):
+        if job.command[0] == engine.INTERNAL_COMMAND:
+            return True
+        if not engine.can_extract(job.source):
+            return False
+        # tar cannot be given include patterns, the engine applies them.
+        return self.config[CONFIG_ENGINE] == ENGINE_INTERNAL or (
+            bool(self.member_filter.include)
+            and tool_name(job.command) == 'tar'
+        )
+
+    def _run_engine_job(self, job):
+        log.info(
+            '[%s] Extracting %s in-process to %s',
+            job.torrent_id,
+            job.source,
+            job.extract_path,
+        )
+
+        def on_progress(progress, bytes_written):
+            job.progress = progress
+            job.bytes_written = bytes_written
+            self.jobs.touch(job)
+
+        return self.engine.extract(job.source, job.extract_path, on_progress,
+                                   self.member_filter, job.max_bytes)
+
+    def _make_work_dir(self, job):
+        """
+        Creates the staging directory of a job when a staging path is set,
+        returning an error message on failure. Runs on a thread.
+        """
+        if not job.staging:
+            return None
+
+        try:
+            fileops.makedirs(job.staging)
+            job.work_dir = tempfile.mkdtemp(
+                prefix=STAGING_PREFIX, dir=job.staging
+            )
+        except OSError as ex:
+            log.error(
+                '[%s] Error creating staging directory: %s',
+                job.torrent_id,
+                ex,
+            )
+            return 'Error creating staging directory: %s' % ex
+        return None
+
+    def _on_staged(self, result, job):
+        """
+        Moves the files of a successful job from its staging directory into
+        its destination, off the reactor thread.
+        """
+        work_dir = job.work_dir
+        if work_dir is None:
+            return result
+
+        if result[0]:
+            job.work_dir = None
+            deferToThread(fileops.remove_tree, work_dir)
+            return result
+
+        log.info(
+            '[%s] Moving extracted files from %s to %s',
+            job.torrent_id,
+            work_dir,
+            job.target,
+        )
+        d = deferToThread(fileops.move_tree, work_dir, job.target)
+        d.addCallbacks(
+            lambda _: result,
+            self._on_move_failed,
+            errbackArgs=(job,),
+        )
+        d.addBoth(self._clear_work_dir, job)
+        return d
+
+    @staticmethod
+    def _on_move_failed(failure, job):
+        log.error(
+            '[%s] Error moving extracted files to %s, they are left in %s: %s',
+            job.torrent_id,
+            job.target,
+            job.work_dir,
+            failure.getErrorMessage(),
+        )
+        return 1, 'Error moving extracted files: %s' % failure.getErrorMessage()
+
+    @staticmethod
+    def _clear_work_dir(result, job):
+        job.work_dir = None
+        return result
+
+    def _on_torrent_file_completed(self, torrent_id, index):
+        """
+        Starts extracting a multi-volume rar set as soon as its first volume
+        has been downloaded when pipelined extraction is enabled.
+        """
+        if not self.config[CONFIG_PIPELINE] or not self._can_pipeline():
+            return
+
+        torrent = component.get('TorrentManager').torrents[torrent_id]
+        files = torrent.get_files()
+        set_root, number = split_volume(files[index]['path'])
+        if set_root is None:
+            return
+
+        pipeline = self.pipelines.get((torrent_id, set_root))
+        if pipeline is not None:
+            location = torrent.get_status(['download_location'])[
+                'download_location'
+            ]
+            pipeline.add_volume(os.path.join(
+                location, os.path.normpath(files[index]['path'])
+            ))
+        elif number == 1 and (torrent_id, set_root) not in self.pipelines:
+            self._start_pipeline(torrent, files, set_root)
+
+    @staticmethod
+    def _can_pipeline():
+        """Only unrar can wait for volumes that are still downloading."""
+        command = EXTRACT_COMMANDS.get('.rar')
+        return bool(command) and os.path.basename(command[0]) == 'unrar'
+
+    def _start_pipeline(self, torrent, files, set_root):
+        torrent_id = torrent.torrent_id
+        torrent_status = torrent.get_status(['download_location', 'name'])
+        torrent_name = torrent_status['name']
+        torrent_location = torrent_status['download_location']
+        torrent_label = component.get('CorePluginManager').get_status(
+            torrent_id, ['label']
+        )['label']
+
+        if not self._is_label_supported(torrent_label):
+            return
+
+        volumes = [
+            (index, os.path.join(
+                torrent_location, os.path.normpath(file['path'])
+            ))
+            for index, file in enumerate(files)
+            if split_volume(file['path'])[0] == set_root
+        ]
+        volumes.sort(key=lambda volume: split_volume(volume[1])[1])
+
+        # Placeholder keeping the set from being started twice while the
+        # destination is prepared.
+        key = (torrent_id, set_root)
+        self.pipelines[key] = None
+        d = deferToThread(
+            self._prepare_pipeline, torrent_name, torrent_location,
+            volumes[0][1],
+        )
+        d.addCallbacks(
+            self._on_pipeline_prepared,
+            self._on_pipeline_prepare_failed,
+            callbackArgs=(torrent, files, key, volumes, torrent_label),
+            errbackArgs=(key, volumes[0][1]),
+        )
+
+    def _prepare_pipeline(self, torrent_name, torrent_location, source):
+        """
+        Creates the destination of a pipelined extraction and a staging
+        directory for it. Runs on a thread.
+        """
+        staging = self.config[CONFIG_STAGING_PATH]
+        extract_path = self._find_destination_path(
+            torrent_name, torrent_location
+        )
+        devices = get_devices([source, extract_path, staging])
+        if extract_path is None:
+            return None, None, None, devices
+
+        if staging:
+            fileops.makedirs(staging)
+            work_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=staging)
+        else:
+            work_dir = None
+        return extract_path, work_dir, make_link_dir(), devices
+
+    def _on_pipeline_prepared(self, prepared, torrent, files, key, volumes,
+                              torrent_label):
+        target, work_dir, link_dir, devices = prepared
+        torrent_id, set_root = key
+        # The placeholder is gone when the torrent finished or the plugin was
+        # disabled in the meantime.
+        if target is None or key not in self.pipelines:
+            self.pipelines.pop(key, None)
+            for path in (work_dir, link_dir):
+                if path:
+                    deferToThread(fileops.remove_tree, path)
+            return
+
+        torrent_name = torrent.get_status(['name'])['name']
+        command = EXTRACT_COMMANDS['.rar']
+
+        job = ExtractJob(
+            None,
+            torrent,
+            command,
+            volumes[0][1],
+            target,
+            torrent_label,
+            sum(files[index]['size'] for index, path in volumes),
+            torrent_name,
+            self.config[CONFIG_STAGING_PATH],
+            devices=devices,
+        )
+        job.work_dir = work_dir
+
+        pipeline = VolumePipeline(job, volumes, link_dir)
+        self.pipelines[key] = pipeline
+        pipeline.add_completed_volumes(torrent.get_file_progress())
+
+        if not torrent.options['sequential_download']:
+            log.info(
+                '[%s] Enabling sequential download for pipelined extraction',
+                torrent_id,
+            )
+            torrent.set_sequential_download(True)
+
+        job.pipeline = pipeline
+        self.jobs.add(job)
+
+        # Queued like any other job so it counts against the global and
+        # per-device limits, volumes completing meanwhile are linked as usual.
+        d = self.scheduler.push(job)
+        d.addErrback(self._on_job_error, job)
+        d.addCallback(self._on_pipeline_done, key, pipeline)
+
+    def _run_pipeline(self, job):
+        """
+        Starts a pipelined extraction once the scheduler lets it run. The set
+        cannot be listed while its volumes are downloading, so its size
+        stands in for its uncompressed size in the free space check.
+        """
+        if self.config[CONFIG_FREE_SPACE] == FREE_SPACE_OFF:
+            return self._spawn_pipeline(job)
+        return self._reserve_space(job, job.size, self._spawn_pipeline)
+
+    def _spawn_pipeline(self, job):
+        if job.cancelled:
+            return 1, CANCELLED_ERROR
+
+        pipeline = job.pipeline
+        command = job.command
+        log.info(
+            '[%s] Extracting %s while downloading to %s',
+            job.torrent_id,
+            job.source,
+            job.extract_path,
+        )
+
+        def on_progress(progress):
+            job.progress = progress
+            self.jobs.touch(job)
+
+        # Without -y unrar asks for missing volumes instead of failing.
+        args = [
+            arg for arg in shlex.split(command[1]) if arg != '-y'
+        ] + ['-p-'] + self.member_filter.arguments(command)[0] + [
+            pipeline.first_volume
+        ]
+        pipeline.protocol = spawn_extractor(
+            command[0],
+            args,
+            str(job.extract_path),
+            os.environ,
+            on_progress=on_progress,
+            on_next_volume=pipeline.on_next_volume,
+            wrapper=self.priority_wrapper,
+        )
+        job.protocol = pipeline.protocol
+        d = pipeline.protocol.deferred
+        d.addCallback(self.member_filter.check_exit, command)
+        d.addCallback(self._on_staged, job)
+        return d
+
+    def _on_pipeline_prepare_failed(self, failure, key, source):
+        self.pipelines.pop(key, None)
+        log.error('[%s] Could not start extracting %s: %s', key[0], source,
+                  failure.getErrorMessage())
+
+    def _on_pipeline_done(self, result, key, pipeline):
+        pipeline.cleanup()
+        pipeline.result = result
+        job = pipeline.job
+
+        if job.counts is not None or result[0]:
+            # Either the torrent is waiting for this set, or the set has to
+            # be extracted again once the torrent finishes.
+            del self.pipelines[key]
+            if job.counts is None:
+                log.warning(
+                    '[%s] Pipelined extraction failed, %s will be extracted '
+                    'again when the torrent finishes',
+                    job.torrent_id,
+                    job.source,
+                )
+
+        self._on_extract(result, job, self.config[CONFIG_PVR_SUPPORT])
+
+    def _adopt_pipeline(self, torrent, counts, file_path):
+        """
+        Returns True when the archive is, or has been, extracted by a
+        pipelined extraction and must not be queued again.
+        """
+        key = (torrent.torrent_id, split_volume(file_path)[0])
+        pipeline = self.pipelines.get(key)
+        if pipeline is None:
+            # Still being prepared, the set is extracted as a whole instead.
+            self.pipelines.pop(key, None)
+            return False
+
+        if pipeline.result is None:
+            counts[KEY_TOTAL] += 1
+            pipeline.job.counts = counts
+            pipeline.add_completed_volumes(torrent.get_file_progress())
+            log.info(
+                '[%s] Waiting on pipelined extraction of %s',
+                torrent.torrent_id,
+                pipeline.job.source,
+            )
+        else:
+            del self.pipelines[key]
+            log.info(
+                '[%s] Already extracted while downloading: %s',
+                torrent.torrent_id,
+                pipeline.job.source,
+            )
+        return True
+
+    def _on_extract(self, result, job, pvr_support):
+        exit_code, output = result
+        counts = job.counts
+        torrent = job.torrent
+        source = job.source
+
+        job.protocol = None
+        job.finished_at = time.time()
+        if exit_code:
+            job.state = JOB_FAILED
+            job.error = output
+        else:
+            job.state = JOB_DONE
+            job.progress = 100
+            job.error = ''
+        self.jobs.finish(job)
+
+        if job.cancelled:
+            # Resumed on the next enable, the torrent is released then.
+            log.info(
+                '[%s] Extraction of %s stopped, the plugin was disabled',
+                torrent.torrent_id,
+                source,
+            )
+            return
+
+        # Jobs of a torrent still downloading are not counted yet.
+        if counts is not None:
+            self._on_counted(counts, torrent, pvr_support, source)
+
+        if not exit_code:
+            log.info(
+                '[%s] Extract successful: %s',
+                torrent.torrent_id,
+                source,
+            )
+            if job.skipped:
+                self._record_metrics(None, job, exit_code)
+            else:
+                d = self._record_manifest(job)
+                d.addCallback(self._record_metrics, job, exit_code)
+        else:
+            self._record_metrics(None, job, exit_code)
+            log.error(
+                '[%s] Extract failed with exit code %d: %s, %s',
+                torrent.torrent_id,
+                exit_code,
+                source,
+                output,
+            )
+
+    def _on_counted(self, counts, torrent, pvr_support, source):
         counts[KEY_COMPLETED] += 1
         log.info(
             '[%s] Extraction count total %d, complete %d',
@@ -328,6 +2273,13 @@ class Core(CorePluginBase):
             counts[KEY_COMPLETED],
         )
 
+        if counts[KEY_TOTAL] == counts[KEY_COMPLETED]:
+            self._active_torrents.discard(torrent.torrent_id)
+
+        if counts[KEY_TOTAL] == counts[KEY_COMPLETED] and \
+                self.journal is not None:
+            self.journal.mark_torrent(torrent.torrent_id)
+
         if pvr_support and counts[KEY_TOTAL] == counts[KEY_COMPLETED]:
             log.info(
                 '[%s] Setting is_finished to true: %s',
@@ -336,42 +2288,101 @@ class Core(CorePluginBase):
             )
             torrent.is_finished = True
 
-        if not result[2]:
-            log.info(
-                '[%s] Extract successful: %s',
+        if counts[KEY_TOTAL] == counts[KEY_COMPLETED] and \
+                counts.get(KEY_TARGET):
+            self.notifier.notify(
                 torrent.torrent_id,
-                source,
+                counts[KEY_TARGET],
+                counts.get(KEY_LABEL, ''),
             )
-        else:
-            log.error(
-                '[%s] Extract failed: %s, %s',
-                torrent.torrent_id,
-                source,
-                result[1]
+
+    def _record_manifest(self, job):
+        """
+        Records the archive of a successful job along with the files it was
+        extracted to, so extracting it again can be skipped.
+        """
+        d = self.lister.list(job.command, job.source)
+        d.addCallback(self.member_filter.filter_entries)
+        d.addCallback(self._on_archive_listed, job)
+        d.addErrback(
+            lambda failure: log.warning(
+                '[%s] Could not record the extraction of %s: %s',
+                job.torrent_id,
+                job.source,
+                failure.getErrorMessage(),
             )
+        )
+        return d
 
-    def _find_extract_command(self, file_path):
-        file_root, file_ext = os.path.splitext(file_path)
-        file_ext_sec = os.path.splitext(file_root)[1]
-
-        if file_ext_sec and file_ext_sec + file_ext in EXTRACT_COMMANDS:
-            return EXTRACT_COMMANDS[file_ext_sec + file_ext]
-        elif file_ext == ".rar" and "part" in file_ext_sec:
-            part_num = file_ext_sec.split("part")[1]
-            if part_num.isdigit() and int(part_num) != 1:
-                log.debug(
-                    'Skipping remaining multi-part rar files: %s',
-                    file_path
-                )
-                return None
-        elif file_ext in EXTRACT_COMMANDS:
-            return EXTRACT_COMMANDS[file_ext]
+    def _on_archive_listed(self, entries, job):
+        if entries is None or self.journal is None:
+            return entries
 
-        log.debug(
-            'Can\'t extract file with unknown file type: %s',
-            file_path
+        d = deferToThread(os.stat, job.source)
+        d.addCallback(self._on_archive_stat, entries, job)
+        return d
+
+    def _on_archive_stat(self, stat, entries, job):
+        # The plugin may have been disabled while the archive was stat'ed.
+        if self.journal is None:
+            return entries
+
+        self.journal.record_manifest(
+            job.torrent_id,
+            job.source,
+            job.target,
+            stat.st_size,
+            stat.st_mtime,
+            [
+                [os.path.join(job.target, os.path.normpath(entry.name)),
+                 entry.size]
+                for entry in entries
+            ],
         )
-        return None
+        if job.content_key:
+            self.journal.record_content(
+                job.content_key, job.torrent_id, job.source, job.target
+            )
+        return entries
+
+    def _record_metrics(self, entries, job, exit_code):
+        """
+        Adds a finished job to the metrics. The bytes written are the size of
+        the listed members when the archive was listed, else what the
+        extractor was last seen writing.
+        """
+        if entries:
+            bytes_out = sum(entry.size for entry in entries)
+        else:
+            bytes_out = job.bytes_written
+
+        started_at = job.started_at or job.finished_at
+        self.metrics.record(
+            archive_format(job),
+            JOB_SKIPPED if job.skipped else job.state,
+            exit_code,
+            started_at - job.queued_at,
+            job.finished_at - started_at,
+            job.size,
+            bytes_out,
+        )
+
+    def _queue_depth(self):
+        """Returns the number of extractions queued and running."""
+        return self.scheduler.queued, self.scheduler.running
+
+    def _render_metrics(self):
+        return self.metrics.to_prometheus(*self._queue_depth())
+
+    def _find_extract_command(self, file_path):
+        command = EXTENSION_INDEX.find_command(os.path.basename(file_path))
+        if command is None:
+            log.debug(
+                'Can\'t extract file with unknown file type, or volume other '
+                'than the first: %s',
+                file_path
+            )
+        return command
 
     def _find_destination_path(self, torrent_name, torrent_location):
         extract_path = os.path.normpath(self.config[CONFIG_EXTRACT_PATH])
@@ -405,8 +2416,119 @@ class Core(CorePluginBase):
         for key in config:
             self.config[key] = config[key]
         self.config.save()
+        self._apply_config()
 
     @export
     def get_config(self):
         """Returns the config dictionary."""
         return self.config.config
+
+    @export
+    def get_jobs(self, since=0):
+        """
+        Returns the extraction jobs changed since the given revision, along
+        with the current revision to pass on the next call.
+        """
+        self._update_bytes_written()
+        return self.jobs.get_changes(since)
+
+    @export
+    def get_stats(self):
+        """
+        Returns the number of extractions queued and running, and the job
+        counts, bytes and time histograms of the finished extractions, in
+        total and by archive format.
+        """
+        return self.metrics.get_stats(*self._queue_depth())
+
+    def _update_bytes_written(self):
+        for job in self.jobs:
+            if self._update_job_bytes(job):
+                self.jobs.touch(job)
+
+    @staticmethod
+    def _update_job_bytes(job):
+        """
+        Reads the bytes written so far by the extractor of a job, returns
+        whether they changed.
+        """
+        if job.protocol is None or job.protocol.transport.pid is None:
+            return False
+
+        io = read_process_io(job.protocol.transport.pid)
+        if io and io.get('wchar', 0) != job.bytes_written:
+            job.bytes_written = io['wchar']
+            return True
+        return False
+
+    def _check_timeouts(self):
+        """
+        Kills the extractors running for longer than job_timeout, or that
+        neither printed anything nor read or wrote a byte for stall_timeout,
+        and nested archive extractions going over their byte budget.
+        In-process extractions enforce their byte budget themselves.
+        """
+        now = time.time()
+        job_timeout = self.config[CONFIG_JOB_TIMEOUT]
+        stall_timeout = self.config[CONFIG_STALL_TIMEOUT]
+
+        for job in self.jobs:
+            protocol = job.protocol
+            if protocol is None or protocol.ended or job.timed_out:
+                continue
+
+            io = read_process_io(protocol.transport.pid or 0)
+            if io:
+                job.bytes_written = max(job.bytes_written, io.get('wchar', 0))
+                activity = io.get('rchar', 0) + io.get('wchar', 0)
+                if activity != job.io_activity:
+                    job.io_activity = activity
+                    protocol.last_activity = now
+
+                if job.max_bytes is not None and \
+                        io.get('wchar', 0) > job.max_bytes:
+                    self._kill_job(job, 'Wrote more than the %s left in the '
+                                        'nested archive budget'
+                                   % fsize(job.max_bytes))
+                    continue
+
+            if protocol.on_next_volume is not None:
+                # Pipelined extractions wait on the download, not on disks.
+                if protocol.next_volume:
+                    protocol.last_activity = now
+            elif job_timeout and now - job.started_at > job_timeout:
+                self._kill_job(job, 'Timed out after %d seconds' % job_timeout)
+                continue
+
+            if stall_timeout and now - protocol.last_activity > stall_timeout:
+                self._kill_job(
+                    job,
+                    'Stalled for %d seconds' % (now - protocol.last_activity),
+                    stalled=True,
+                )
+
+    def _cancel_job(self, job):
+        """
+        Stops a running job when the plugin is disabled. It is not retried
+        and its end is not journaled, so it is resumed on the next enable.
+        Returns a Deferred firing once the job has ended.
+        """
+        job.cancelled = True
+        ended = Deferred()
+        job.deferred.addBoth(self._on_cancelled_job_ended, ended)
+        if job.protocol is not None and not job.protocol.ended:
+            self._kill_job(job, 'Plugin disabled')
+        return ended
+
+    @staticmethod
+    def _on_cancelled_job_ended(result, ended):
+        ended.callback(None)
+        return result
+
+    @staticmethod
+    def _kill_job(job, reason, stalled=False):
+        log.warning('[%s] %s, killing the extraction of %s', job.torrent_id,
+                    reason, job.source)
+        job.timed_out = reason
+        job.stalled = stalled
+        job.protocol.terminate()
@@ -21,12 +21,22 @@ Deluge.ux.preferences.PVRExtractorPage = Ext.extend(Ext.Panel, {
     border: false,
 
     configLoaded: false,
+    jobsRevision: 0,
     configKeys: {
         extractPath: 'extract_path',
         supportedLabels: 'supported_labels',
         nameFolder: 'use_name_folder',
         inPlaceExtract: 'in_place_extraction',
         pvrSupport: 'sonarr_radarr_support',
+        maxJobs: 'max_concurrent_jobs',
+        jobOrder: 'job_order',
+        labelPriority: 'label_priority',
+        niceLevel: 'nice_level',
+        ioniceClass: 'ionice_class',
+        ioniceLevel: 'ionice_level',
+        cgroupPath: 'cgroup_path',
+        cgroupCpuMax: 'cgroup_cpu_max',
+        cgroupIoMax: 'cgroup_io_max',
     },
 
     initComponent: function () {
@@ -87,7 +97,205 @@ Deluge.ux.preferences.PVRExtractorPage = Ext.extend(Ext.Panel, {
             boxLabel: _('Enable support for Sonarr, Radarr'),
         });
 
+        schedulingFieldset = this.form.add({
+            xtype: 'fieldset',
+            border: false,
+            title: _('Scheduling'),
+            autoHeight: true,
+            labelWidth: 150,
+            defaultType: 'textfield',
+        });
+
+        this.max_concurrent_jobs = schedulingFieldset.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('Concurrent extractions'),
+            name: 'max_concurrent_jobs',
+            width: 60,
+            minValue: 1,
+            maxValue: 64,
+            decimalPrecision: 0,
+        });
+
+        this.job_order = schedulingFieldset.add({
+            xtype: 'combo',
+            fieldLabel: _('Queue order'),
+            name: 'job_order',
+            mode: 'local',
+            store: new Ext.data.ArrayStore({
+                fields: ['id', 'text'],
+                data: [
+                    ['fifo', _('First in, first out')],
+                    ['smallest_first', _('Smallest archive first')],
+                    ['label', _('By label priority')],
+                ],
+            }),
+            valueField: 'id',
+            displayField: 'text',
+            editable: false,
+            triggerAction: 'all',
+            width: 180,
+        });
+
+        this.label_priority = schedulingFieldset.add({
+            fieldLabel: _('Label priority'),
+            name: 'label_priority',
+            width: '60%',
+        });
+
+        priorityFieldset = this.form.add({
+            xtype: 'fieldset',
+            border: false,
+            title: _('Process Priority'),
+            autoHeight: true,
+            labelWidth: 150,
+            defaultType: 'textfield',
+        });
+
+        this.nice_level = priorityFieldset.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('CPU priority (nice)'),
+            name: 'nice_level',
+            width: 60,
+            minValue: 0,
+            maxValue: 19,
+            decimalPrecision: 0,
+        });
+
+        this.ionice_class = priorityFieldset.add({
+            xtype: 'combo',
+            fieldLabel: _('I/O class'),
+            name: 'ionice_class',
+            mode: 'local',
+            store: new Ext.data.ArrayStore({
+                fields: ['id', 'text'],
+                data: [
+                    ['none', _('Unchanged')],
+                    ['idle', _('Idle')],
+                    ['best-effort', _('Best effort')],
+                    ['realtime', _('Realtime')],
+                ],
+            }),
+            valueField: 'id',
+            displayField: 'text',
+            editable: false,
+            triggerAction: 'all',
+            width: 180,
+        });
+
+        this.ionice_level = priorityFieldset.add({
+            xtype: 'spinnerfield',
+            fieldLabel: _('I/O priority'),
+            name: 'ionice_level',
+            width: 60,
+            minValue: 0,
+            maxValue: 7,
+            decimalPrecision: 0,
+        });
+
+        this.cgroup_path = priorityFieldset.add({
+            fieldLabel: _('Control group'),
+            name: 'cgroup_path',
+            width: '60%',
+        });
+
+        this.cgroup_cpu_max = priorityFieldset.add({
+            fieldLabel: _('cpu.max'),
+            name: 'cgroup_cpu_max',
+            width: '60%',
+        });
+
+        this.cgroup_io_max = priorityFieldset.add({
+            fieldLabel: _('io.max'),
+            name: 'cgroup_io_max',
+            width: '60%',
+        });
+
+        this.jobsGrid = this.form.add({
+            xtype: 'grid',
+            title: _('Extraction jobs'),
+            height: 200,
+            autoScroll: true,
+            store: new Ext.data.JsonStore({
+                idProperty: 'id',
+                fields: [
+                    'id', 'name', 'archive', 'state', 'progress', 'bytes_written', 'error',
+                ],
+            }),
+            columns: [
+                {header: _('Torrent'), dataIndex: 'name', width: 160, sortable: true},
+                {header: _('Archive'), dataIndex: 'archive', width: 140, sortable: true},
+                {header: _('State'), dataIndex: 'state', width: 60, sortable: true},
+                {
+                    header: _('Progress'),
+                    dataIndex: 'progress',
+                    width: 90,
+                    renderer: function (value) {
+                        return value == null ? '' : Deluge.progressBar(value, 84, value + '%');
+                    },
+                },
+                {header: _('Written'), dataIndex: 'bytes_written', width: 70, renderer: fsize},
+            ],
+        });
+
+        this.jobsTask = {
+            run: this.updateJobs,
+            scope: this,
+            interval: 2000,
+        };
+
         this.on('show', this.updateConfig, this);
+        this.on('show', this.startJobsTask, this);
+        this.on('hide', this.stopJobsTask, this);
+        this.on('destroy', this.stopJobsTask, this);
+        deluge.preferences.on('hide', this.stopJobsTask, this);
+    },
+
+    startJobsTask: function () {
+        Ext.TaskMgr.start(this.jobsTask);
+    },
+
+    stopJobsTask: function () {
+        Ext.TaskMgr.stop(this.jobsTask);
+    },
+
+    onDestroy: function () {
+        deluge.preferences.un('hide', this.stopJobsTask, this);
+        Deluge.ux.preferences.PVRExtractorPage.superclass.onDestroy.call(this);
+    },
+
+    updateJobs: function () {
+        // Only the jobs changed since the last known revision are sent back.
+        deluge.client.pvrextractor.get_jobs(this.jobsRevision, {
+            success: function (changes) {
+                var store = this.jobsGrid.getStore();
+
+                if (changes.full) {
+                    store.removeAll();
+                }
+
+                Ext.each(changes.removed, function (id) {
+                    var record = store.getById(id);
+                    if (record) {
+                        store.remove(record);
+                    }
+                });
+
+                Ext.each(changes.jobs, function (job) {
+                    var record = store.getById(job.id);
+                    if (record) {
+                        Ext.iterate(job, function (key, value) {
+                            record.set(key, value);
+                        });
+                        record.commit();
+                    } else {
+                        store.add(new store.recordType(job, job.id));
+                    }
+                });
+
+                this.jobsRevision = changes.revision;
+            },
+            scope: this,
+        });
     },
 
     onApply: function () {
@@ -99,6 +307,15 @@ Deluge.ux.preferences.PVRExtractorPage = Ext.extend(Ext.Panel, {
                 [this.configKeys.nameFolder]: this.use_name_folder.getValue(),
                 [this.configKeys.inPlaceExtract]: this.in_place_extraction.getValue(),
                 [this.configKeys.pvrSupport]: this.sonarr_radarr_support.getValue(),
+                [this.configKeys.maxJobs]: this.max_concurrent_jobs.getValue(),
+                [this.configKeys.jobOrder]: this.job_order.getValue(),
+                [this.configKeys.labelPriority]: this.label_priority.getValue(),
+                [this.configKeys.niceLevel]: this.nice_level.getValue(),
+                [this.configKeys.ioniceClass]: this.ionice_class.getValue(),
+                [this.configKeys.ioniceLevel]: this.ionice_level.getValue(),
+                [this.configKeys.cgroupPath]: this.cgroup_path.getValue(),
+                [this.configKeys.cgroupCpuMax]: this.cgroup_cpu_max.getValue(),
+                [this.configKeys.cgroupIoMax]: this.cgroup_io_max.getValue(),
             });
         }
     },
@@ -115,6 +332,15 @@ Deluge.ux.preferences.PVRExtractorPage = Ext.extend(Ext.Panel, {
                 this.use_name_folder.setValue(config[this.configKeys.nameFolder]);
                 this.in_place_extraction.setValue(config[this.configKeys.inPlaceExtract]);
                 this.sonarr_radarr_support.setValue(config[this.configKeys.pvrSupport]);
+                this.max_concurrent_jobs.setValue(config[this.configKeys.maxJobs]);
+                this.job_order.setValue(config[this.configKeys.jobOrder]);
+                this.label_priority.setValue(config[this.configKeys.labelPriority]);
+                this.nice_level.setValue(config[this.configKeys.niceLevel]);
+                this.ionice_class.setValue(config[this.configKeys.ioniceClass]);
+                this.ionice_level.setValue(config[this.configKeys.ioniceLevel]);
+                this.cgroup_path.setValue(config[this.configKeys.cgroupPath]);
+                this.cgroup_cpu_max.setValue(config[this.configKeys.cgroupCpuMax]);
+                this.cgroup_io_max.setValue(config[this.configKeys.cgroupIoMax]);
                 this.configLoaded = true;
             },
             scope: this,
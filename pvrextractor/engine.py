@@ -0,0 +1,311 @@
+#
+# engine.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import tarfile
+import threading
+import zipfile
+from contextlib import closing
+
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
+
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue  # For Python 2.
+
+log = logging.getLogger(__name__)
+
+# Command name used in EXTRACT_COMMANDS for archives handled in-process.
+INTERNAL_COMMAND = 'internal'
+
+ZIP_EXTENSIONS = ['.zip']
+TAR_EXTENSIONS = [
+    '.tar',
+    '.tar.gz', '.tgz',
+    '.tar.bz2', '.tbz',
+    '.tar.lzma', '.tlz',
+    '.tar.xz', '.txz',
+]
+EXTENSIONS = ZIP_EXTENSIONS + TAR_EXTENSIONS
+
+COPY_BUFFER_SIZE = 1024 * 1024
+DEFAULT_THREADS = 4
+
+
+class UnsafeMemberError(Exception):
+    """Raised for archive members that would be written outside the target."""
+
+
+class ExtractCancelled(Exception):
+    """Raised in the extracting threads once stop has been called."""
+
+
+class ByteLimitError(Exception):
+    """Raised once an extraction has written more than it may."""
+
+
+def can_extract(path):
+    return path.lower().endswith(tuple(EXTENSIONS))
+
+
+def member_path(target, name):
+    """
+    Returns where the member name is extracted to in target, refusing absolute
+    names and names escaping target with `..`.
+    """
+    parts = name.replace('\\', '/').split('/')
+    if name.startswith('/') or '..' in parts:
+        raise UnsafeMemberError('Refusing to extract unsafe member %s' % name)
+    return os.path.join(target, *[part for part in parts if part])
+
+
+class ExtractEngine(object):
+    """
+    Extracts zip and tar archives in-process with zipfile and tarfile, saving
+    a fork and exec per archive and keeping zip and tar support when unzip or
+    tar are not installed.
+
+    Every archive is read on a reactor pool thread. The members of a zip
+    archive are independent, so they are also decompressed and written in
+    parallel by up to `threads` workers of their own. Tar archives are a
+    single stream and are extracted sequentially.
+    """
+
+    def __init__(self, threads=DEFAULT_THREADS):
+        self.threads = threads
+        self._running = set()
+
+    def stop(self):
+        """
+        Cancels the running extractions, which end with an error as soon as
+        they next write.
+        """
+        for progress in self._running:
+            progress.cancelled = True
+
+    def extract(self, source, target, on_progress=None, member_filter=None,
+                max_bytes=None):
+        """
+        Extracts source into target off the reactor thread and returns a
+        Deferred firing with a tuple of exit code and error message, like the
+        external extractors.
+
+        on_progress is called on the reactor thread with the percentage done
+        and the number of bytes written. Only the members matched by
+        member_filter, a MemberFilter, are extracted when it is given. The
+        extraction fails as soon as it writes more than max_bytes, when given.
+        """
+        progress = _Progress(on_progress, max_bytes)
+        if not member_filter:
+            member_filter = None
+
+        if source.lower().endswith(tuple(ZIP_EXTENSIONS)):
+            func = self._extract_zip
+        else:
+            func = self._extract_tar
+        self._running.add(progress)
+        d = deferToThread(self._run, func, source, target, progress,
+                          member_filter)
+        d.addBoth(self._on_done, progress)
+        return d
+
+    def _on_done(self, result, progress):
+        self._running.discard(progress)
+        return result
+
+    @staticmethod
+    def _run(func, source, target, progress, member_filter):
+        try:
+            func(source, target, progress, member_filter)
+        except Exception as ex:
+            log.debug('In-process extraction of %s failed', source,
+                      exc_info=True)
+            return 1, '%s: %s' % (type(ex).__name__, ex)
+        return 0, ''
+
+    def _extract_zip(self, source, target, progress, member_filter):
+        with zipfile.ZipFile(source) as archive:
+            members = archive.infolist()
+            if member_filter is not None:
+                # Folders are created along with the files kept in them.
+                members = [
+                    member for member in members
+                    if not _is_zip_dir(member) and
+                    member_filter.matches(member.filename)
+                ]
+            progress.total = sum(member.file_size for member in members)
+
+            files = []
+            for member in members:
+                path = member_path(target, member.filename)
+                if _is_zip_dir(member):
+                    _makedirs(path)
+                else:
+                    _makedirs(os.path.dirname(path))
+                    files.append((member, path))
+
+            # ZipFile serialises the reads of the shared file handle, the
+            # decompression and writes of the members run in parallel.
+            queue = Queue()
+            for item in files:
+                queue.put(item)
+            errors = []
+            workers = [
+                threading.Thread(
+                    target=self._zip_worker,
+                    args=(archive, queue, progress, errors),
+                )
+                for _ in range(min(max(1, self.threads), len(files)))
+            ]
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+            for worker in workers:
+                worker.join()
+            if errors:
+                raise errors[0]
+
+    @classmethod
+    def _zip_worker(cls, archive, queue, progress, errors):
+        # Workers stop taking members once one of them has failed.
+        while not errors:
+            try:
+                member, path = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                cls._extract_zip_member(archive, member, path, progress)
+            except Exception as ex:
+                errors.append(ex)
+
+    @staticmethod
+    def _extract_zip_member(archive, member, path, progress):
+        with archive.open(member) as src, open(path, 'wb') as dst:
+            _copy(src, dst, progress)
+
+    @staticmethod
+    def _extract_tar(source, target, progress, member_filter):
+        progress.total = os.path.getsize(source)
+
+        with open(source, 'rb') as raw, \
+                tarfile.open(fileobj=raw, mode='r:*') as archive:
+            # Progress of a compressed stream is measured on the compressed
+            # bytes read.
+            progress.position = raw.tell
+
+            for member in archive:
+                if member_filter is not None and (
+                        member.isdir() or
+                        not member_filter.matches(member.name)):
+                    continue
+
+                path = member_path(target, member.name)
+                if member.isdir():
+                    _makedirs(path)
+                elif member.isfile():
+                    _makedirs(os.path.dirname(path))
+                    with closing(archive.extractfile(member)) as src, \
+                            open(path, 'wb') as dst:
+                        _copy(src, dst, progress)
+                    os.chmod(path, member.mode & 0o777)
+                elif hasattr(tarfile, 'data_filter'):
+                    # Links are validated by the data filter where available.
+                    archive.extract(member, target, filter='data')
+                else:
+                    log.warning(
+                        'Skipping %s in %s, links and special files are not '
+                        'supported', member.name, source
+                    )
+                progress.update(0)
+
+
+class _Progress(object):
+    """Thread-safe progress of an extraction, reported on the reactor."""
+
+    def __init__(self, callback, max_bytes=None):
+        self.callback = callback
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.done = 0
+        self.position = None
+        self.percent = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def update(self, written):
+        if self.cancelled:
+            raise ExtractCancelled('Extraction cancelled')
+
+        with self._lock:
+            self.done += written
+            if self.max_bytes is not None and self.done > self.max_bytes:
+                raise ByteLimitError(
+                    'Wrote more than the %d bytes allowed' % self.max_bytes
+                )
+            position = self.position() if self.position else self.done
+            percent = int(100 * position / self.total) if self.total else 0
+            if percent == self.percent or self.callback is None:
+                return
+            self.percent = percent
+            done = self.done
+
+        reactor.callFromThread(self.callback, min(100, percent), done)
+
+
+def _is_zip_dir(member):
+    return member.filename.endswith('/')
+
+
+def _copy(src, dst, progress):
+    while True:
+        buf = src.read(COPY_BUFFER_SIZE)
+        if not buf:
+            break
+        dst.write(buf)
+        progress.update(len(buf))
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
@@ -0,0 +1,242 @@
+#
+# fileops.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+from __future__ import unicode_literals
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Not available on Windows.
+
+log = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+# Bytes hashed at the start and at the end of a file by partial_hash.
+PARTIAL_HASH_LENGTH = 1024 * 1024
+# Suffix of the files being copied into their destination.
+PARTIAL_SUFFIX = '.pvrextractor-part'
+
+# ioctl cloning a whole file, sharing its blocks, on btrfs, XFS and others.
+FICLONE = 0x40049409
+
+# os.rename does not replace existing files on Windows.
+replace = getattr(os, 'replace', os.rename)
+
+
+def makedirs(path):
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+
+def free_space(path):
+    """
+    Returns the bytes available to the daemon on the filesystem holding path,
+    or its closest existing parent.
+    """
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+
+    if hasattr(shutil, 'disk_usage'):
+        return shutil.disk_usage(path).free
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+def partial_hash(path, length=PARTIAL_HASH_LENGTH):
+    """Returns the SHA-1 of the first and last length bytes of a file."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as src:
+        digest.update(src.read(length))
+        size = os.fstat(src.fileno()).st_size
+        if size > length:
+            src.seek(max(length, size - length))
+            digest.update(src.read(length))
+    return digest.hexdigest()
+
+
+def find_new_files(path, since):
+    """
+    Returns the files under path created or changed since the given time.
+    Extractors restore the modification time of the files, not the change
+    time.
+    """
+    new_files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in filenames:
+            file_path = os.path.join(dirpath, name)
+            try:
+                if os.lstat(file_path).st_ctime >= since:
+                    new_files.append(file_path)
+            except OSError:
+                pass
+    return new_files
+
+
+def move_tree(source, target):
+    """
+    Moves the contents of the directory source into the directory target,
+    merging them with the directories already there, and removes source.
+
+    Files are renamed into place when source and target are on the same
+    filesystem. Otherwise they are copied sequentially to a temporary name
+    next to their destination and renamed once complete, so a file in target
+    is never seen half-written.
+    """
+    for dirpath, dirnames, filenames in os.walk(source):
+        dest_dir = os.path.normpath(
+            os.path.join(target, os.path.relpath(dirpath, source))
+        )
+        makedirs(dest_dir)
+
+        # Links to directories are moved as links, not walked into.
+        links = [name for name in dirnames
+                 if os.path.islink(os.path.join(dirpath, name))]
+        dirnames[:] = [name for name in dirnames if name not in links]
+
+        for name in sorted(filenames + links):
+            move_file(os.path.join(dirpath, name), os.path.join(dest_dir, name))
+
+    shutil.rmtree(source)
+
+
+def move_file(source, target):
+    try:
+        replace(source, target)
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+        copy_file(source, target)
+        os.remove(source)
+
+
+def copy_file(source, target):
+    partial = target + PARTIAL_SUFFIX
+    try:
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), partial)
+        else:
+            with open(source, 'rb') as src, open(partial, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            shutil.copystat(source, partial)
+        replace(partial, target)
+    except Exception:
+        if os.path.lexists(partial):
+            os.remove(partial)
+        raise
+
+
+def write_file(path, data):
+    """
+    Replaces the contents of path with data, bytes, without readers ever
+    seeing a half-written file.
+    """
+    partial = path + PARTIAL_SUFFIX
+    try:
+        with open(partial, 'wb') as dst:
+            dst.write(data)
+        replace(partial, path)
+    except Exception:
+        if os.path.lexists(partial):
+            os.remove(partial)
+        raise
+
+
+def remove_tree(path):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def link_file(source, target):
+    """
+    Puts the contents of source at target for the lowest I/O cost: a hard
+    link, else a reflink sharing the blocks of source, else a copy. Returns
+    `hardlink`, `reflink` or `copy`, or None when target already is source or
+    a file of the same size.
+    """
+    if os.path.exists(target) and (
+            os.path.samefile(source, target)
+            or os.path.getsize(source) == os.path.getsize(target)):
+        return None
+
+    makedirs(os.path.dirname(target))
+    partial = target + PARTIAL_SUFFIX
+    if os.path.lexists(partial):
+        os.remove(partial)
+    try:
+        os.link(source, partial)
+    except OSError:
+        pass
+    else:
+        replace(partial, target)
+        return 'hardlink'
+
+    try:
+        reflink_file(source, target)
+    except (IOError, OSError):
+        pass
+    else:
+        return 'reflink'
+
+    copy_file(source, target)
+    return 'copy'
+
+
+def reflink_file(source, target):
+    """Clones source to target, failing where reflinks are not supported."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported')
+
+    partial = target + PARTIAL_SUFFIX
+    try:
+        with open(source, 'rb') as src, open(partial, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(source, partial)
+        replace(partial, target)
+    except Exception:
+        if os.path.lexists(partial):
+            os.remove(partial)
+        raise
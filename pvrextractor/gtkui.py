@@ -46,10 +46,11 @@ import gi  # isort:skip (Required before Gtk import).
 gi.require_version('Gtk', '3.0')  # NOQA: E402
 
 # isort:imports-thirdparty
-from gi.repository import Gtk
+from gi.repository import GLib, Gtk
 
 # isort:imports-firstparty
 import deluge.component as component
+from deluge.common import fsize
 from deluge.plugins.pluginbase import Gtk3PluginBase
 from deluge.ui.client import client
 
@@ -64,6 +65,26 @@ CONFIG_SUPPORTED_LABELS = 'supported_labels'
 CONFIG_NAME_FOLDER = 'use_name_folder'
 CONFIG_IN_PLACE_EXTRACT = 'in_place_extraction'
 CONFIG_PVR_SUPPORT = 'sonarr_radarr_support'
+CONFIG_MAX_JOBS = 'max_concurrent_jobs'
+CONFIG_JOB_ORDER = 'job_order'
+CONFIG_LABEL_PRIORITY = 'label_priority'
+CONFIG_NICE_LEVEL = 'nice_level'
+CONFIG_IONICE_CLASS = 'ionice_class'
+CONFIG_IONICE_LEVEL = 'ionice_level'
+CONFIG_CGROUP_PATH = 'cgroup_path'
+CONFIG_CGROUP_CPU_MAX = 'cgroup_cpu_max'
+CONFIG_CGROUP_IO_MAX = 'cgroup_io_max'
+
+JOBS_POLL_INTERVAL = 2
+
+(
+    JOB_COLUMN_ID,
+    JOB_COLUMN_NAME,
+    JOB_COLUMN_ARCHIVE,
+    JOB_COLUMN_STATE,
+    JOB_COLUMN_PROGRESS,
+    JOB_COLUMN_WRITTEN,
+) = range(6)
 
 
 class GtkUI(Gtk3PluginBase):
@@ -80,9 +101,11 @@ class GtkUI(Gtk3PluginBase):
         component.get('PluginManager').register_hook(
             'on_show_prefs', self.on_show_prefs
         )
+        self.setup_jobs_view()
         self.on_show_prefs()
 
     def disable(self):
+        self.stop_jobs_poll()
         component.get('Preferences').remove_page(_(PAGE_NAME))
         component.get('PluginManager').deregister_hook(
             'on_apply_prefs', self.on_apply_prefs
@@ -108,7 +131,25 @@ class GtkUI(Gtk3PluginBase):
             CONFIG_IN_PLACE_EXTRACT:
                 self.get_in_place_extract_object().get_active(),
             CONFIG_PVR_SUPPORT:
-                self.builder.get_pvr_support_object().get_active()
+                self.get_pvr_support_object().get_active(),
+            CONFIG_MAX_JOBS:
+                self.get_max_jobs_object().get_value_as_int(),
+            CONFIG_JOB_ORDER:
+                self.get_job_order_object().get_active_id(),
+            CONFIG_LABEL_PRIORITY:
+                self.get_label_priority_object().get_text(),
+            CONFIG_NICE_LEVEL:
+                self.get_nice_level_object().get_value_as_int(),
+            CONFIG_IONICE_CLASS:
+                self.get_ionice_class_object().get_active_id(),
+            CONFIG_IONICE_LEVEL:
+                self.get_ionice_level_object().get_value_as_int(),
+            CONFIG_CGROUP_PATH:
+                self.get_cgroup_path_object().get_text(),
+            CONFIG_CGROUP_CPU_MAX:
+                self.get_cgroup_cpu_max_object().get_text(),
+            CONFIG_CGROUP_IO_MAX:
+                self.get_cgroup_io_max_object().get_text(),
         }
 
         client.pvrextractor.set_config(config)
@@ -140,12 +181,119 @@ class GtkUI(Gtk3PluginBase):
             self.get_in_place_extract_object().set_active(
                 config[CONFIG_IN_PLACE_EXTRACT]
             )
-            config.get_pvr_support_object().set_active(
+            self.get_pvr_support_object().set_active(
                 config[CONFIG_PVR_SUPPORT]
             )
+            self.get_max_jobs_object().set_value(
+                config[CONFIG_MAX_JOBS]
+            )
+            self.get_job_order_object().set_active_id(
+                config[CONFIG_JOB_ORDER]
+            )
+            self.get_label_priority_object().set_text(
+                config[CONFIG_LABEL_PRIORITY]
+            )
+            self.get_nice_level_object().set_value(
+                config[CONFIG_NICE_LEVEL]
+            )
+            self.get_ionice_class_object().set_active_id(
+                config[CONFIG_IONICE_CLASS]
+            )
+            self.get_ionice_level_object().set_value(
+                config[CONFIG_IONICE_LEVEL]
+            )
+            self.get_cgroup_path_object().set_text(
+                config[CONFIG_CGROUP_PATH]
+            )
+            self.get_cgroup_cpu_max_object().set_text(
+                config[CONFIG_CGROUP_CPU_MAX]
+            )
+            self.get_cgroup_io_max_object().set_text(
+                config[CONFIG_CGROUP_IO_MAX]
+            )
 
         client.pvrextractor.get_config().addCallback(on_get_config)
 
+    def setup_jobs_view(self):
+        self.jobs_store = Gtk.ListStore(int, str, str, str, int, str)
+        self.jobs_rows = {}
+        self.jobs_revision = 0
+        self.jobs_timer = None
+
+        view = self.get_jobs_view_object()
+        view.set_model(self.jobs_store)
+        view.append_column(Gtk.TreeViewColumn(
+            _('Torrent'), Gtk.CellRendererText(), text=JOB_COLUMN_NAME
+        ))
+        view.append_column(Gtk.TreeViewColumn(
+            _('Archive'), Gtk.CellRendererText(), text=JOB_COLUMN_ARCHIVE
+        ))
+        view.append_column(Gtk.TreeViewColumn(
+            _('State'), Gtk.CellRendererText(), text=JOB_COLUMN_STATE
+        ))
+        view.append_column(Gtk.TreeViewColumn(
+            _('Progress'), Gtk.CellRendererProgress(),
+            value=JOB_COLUMN_PROGRESS
+        ))
+        view.append_column(Gtk.TreeViewColumn(
+            _('Written'), Gtk.CellRendererText(), text=JOB_COLUMN_WRITTEN
+        ))
+
+        # Only poll the daemon while the jobs are on screen.
+        view.connect('map', lambda widget: self.start_jobs_poll())
+        view.connect('unmap', lambda widget: self.stop_jobs_poll())
+
+    def start_jobs_poll(self):
+        if self.jobs_timer is None:
+            self.update_jobs()
+            self.jobs_timer = GLib.timeout_add_seconds(
+                JOBS_POLL_INTERVAL, self.update_jobs
+            )
+
+    def stop_jobs_poll(self):
+        if self.jobs_timer is not None:
+            GLib.source_remove(self.jobs_timer)
+            self.jobs_timer = None
+
+    def update_jobs(self):
+        client.pvrextractor.get_jobs(self.jobs_revision).addCallback(
+            self.on_get_jobs
+        )
+        return True
+
+    def on_get_jobs(self, changes):
+        """Applies the jobs changed since the last poll to the jobs view."""
+        if changes['full']:
+            self.jobs_store.clear()
+            self.jobs_rows = {}
+
+        for job_id in changes['removed']:
+            row = self.jobs_rows.pop(job_id, None)
+            if row is not None and row.valid():
+                self.jobs_store.remove(self.jobs_store.get_iter(row.get_path()))
+
+        for job in changes['jobs']:
+            values = [
+                job['id'],
+                job['name'],
+                job['archive'],
+                job['state'],
+                job['progress'] or 0,
+                fsize(job['bytes_written']),
+            ]
+            row = self.jobs_rows.get(job['id'])
+            if row is not None and row.valid():
+                self.jobs_store.set_row(
+                    self.jobs_store.get_iter(row.get_path()), values
+                )
+            else:
+                tree_iter = self.jobs_store.append(values)
+                self.jobs_rows[job['id']] = Gtk.TreeRowReference.new(
+                    self.jobs_store, self.jobs_store.get_path(tree_iter)
+                )
+
+        self.jobs_revision = changes['revision']
+
     def get_entry_path_object(self):
         return self.builder.get_object('entry_path')
 
@@ -163,3 +311,33 @@ class GtkUI(Gtk3PluginBase):
 
     def get_pvr_support_object(self):
         return self.builder.get_object('chk_sonarr_radarr_support')
+
+    def get_max_jobs_object(self):
+        return self.builder.get_object('spin_max_jobs')
+
+    def get_job_order_object(self):
+        return self.builder.get_object('combo_job_order')
+
+    def get_label_priority_object(self):
+        return self.builder.get_object('txt_label_priority')
+
+    def get_nice_level_object(self):
+        return self.builder.get_object('spin_nice_level')
+
+    def get_ionice_class_object(self):
+        return self.builder.get_object('combo_ionice_class')
+
+    def get_ionice_level_object(self):
+        return self.builder.get_object('spin_ionice_level')
+
+    def get_cgroup_path_object(self):
+        return self.builder.get_object('txt_cgroup_path')
+
+    def get_cgroup_cpu_max_object(self):
+        return self.builder.get_object('txt_cgroup_cpu_max')
+
+    def get_cgroup_io_max_object(self):
+        return self.builder.get_object('txt_cgroup_io_max')
+
+    def get_jobs_view_object(self):
+        return self.builder.get_object('treeview_jobs')
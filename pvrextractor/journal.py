@@ -0,0 +1,287 @@
+#
+# journal.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    torrent_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    command TEXT NOT NULL,
+    label TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (torrent_id, source)
+);
+CREATE TABLE IF NOT EXISTS torrents (
+    torrent_id TEXT NOT NULL PRIMARY KEY,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS manifest (
+    torrent_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    outputs TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (source, target)
+);
+CREATE TABLE IF NOT EXISTS content (
+    content_key TEXT NOT NULL,
+    torrent_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (source, target)
+);
+CREATE INDEX IF NOT EXISTS content_key_index ON content (content_key);
+"""
+
+
+class JournalEntry(object):
+    """A job as recorded in the journal."""
+
+    def __init__(self, torrent_id, source, target, command, label, size, name,
+                 state, updated):
+        self.torrent_id = torrent_id
+        self.source = source
+        self.target = target
+        self.command = json.loads(command)
+        self.label = label
+        self.size = size
+        self.name = name
+        self.state = state
+        self.updated = updated
+
+
+class ManifestEntry(object):
+    """An archive extracted to a target, as it was then and what it wrote."""
+
+    def __init__(self, torrent_id, source, target, size, mtime, outputs,
+                 updated):
+        self.torrent_id = torrent_id
+        self.source = source
+        self.target = target
+        self.size = size
+        self.mtime = mtime
+        self.outputs = json.loads(outputs)
+        self.updated = updated
+
+
+class Journal(object):
+    """
+    Records the state of every extraction job in an SQLite database so that
+    queued and interrupted jobs survive a daemon restart.
+
+    Jobs are keyed on their torrent and archive, recording a job again
+    replaces its previous state. Torrents whose extraction is complete are
+    marked as such.
+
+    The manifest records the size and modification time of every extracted
+    archive along with the paths and sizes of the files it was extracted to.
+    Archives are also recorded under a key of their content, so identical
+    archives of other torrents can be found.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Whether open created the database, it knows no torrent yet then.
+        self.created = False
+        self._db = None
+
+    def open(self):
+        self.created = not os.path.exists(self.path)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def record(self, job):
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    job.torrent_id,
+                    job.source,
+                    job.target,
+                    json.dumps(job.command),
+                    job.label,
+                    job.size,
+                    job.name,
+                    job.state,
+                    time.time(),
+                )
+            )
+
+    def get_entries(self, states=None, torrent_id=None):
+        """Returns the recorded jobs, optionally filtered on state and torrent."""
+        query = 'SELECT * FROM jobs WHERE 1'
+        params = []
+        if states:
+            query += ' AND state IN (%s)' % ', '.join('?' * len(states))
+            params.extend(states)
+        if torrent_id is not None:
+            query += ' AND torrent_id = ?'
+            params.append(torrent_id)
+
+        return [
+            JournalEntry(*row)
+            for row in self._db.execute(query + ' ORDER BY rowid', params)
+        ]
+
+    def mark_torrent(self, torrent_id):
+        """Marks a torrent as completely extracted."""
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO torrents VALUES (?, ?)',
+                (torrent_id, time.time())
+            )
+
+    def mark_torrents(self, torrent_ids):
+        """Marks many torrents as completely extracted at once."""
+        now = time.time()
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO torrents VALUES (?, ?)',
+                [(torrent_id, now) for torrent_id in torrent_ids]
+            )
+
+    def get_known_torrents(self):
+        """Returns the ids of the torrents marked or with recorded jobs."""
+        return set(
+            row[0] for row in self._db.execute(
+                'SELECT torrent_id FROM torrents '
+                'UNION SELECT torrent_id FROM jobs'
+            )
+        )
+
+    def is_known(self, torrent_id):
+        """Returns whether a torrent is marked or has recorded jobs."""
+        return self._db.execute(
+            'SELECT 1 FROM torrents WHERE torrent_id = ? '
+            'UNION SELECT 1 FROM jobs WHERE torrent_id = ?',
+            (torrent_id, torrent_id)
+        ).fetchone() is not None
+
+    def record_manifest(self, torrent_id, source, target, size, mtime,
+                        outputs):
+        """Records the outputs, a list of [path, size], of an archive."""
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO manifest VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    torrent_id,
+                    source,
+                    target,
+                    size,
+                    mtime,
+                    json.dumps(outputs),
+                    time.time(),
+                )
+            )
+
+    def get_manifest(self, source, target):
+        """Returns the ManifestEntry of an archive, or None."""
+        row = self._db.execute(
+            'SELECT * FROM manifest WHERE source = ? AND target = ?',
+            (source, target)
+        ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record_content(self, content_key, torrent_id, source, target):
+        """Records the content key of an archive in the manifest."""
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO content VALUES (?, ?, ?, ?)',
+                (content_key, torrent_id, source, target)
+            )
+
+    def find_content(self, content_key, source, target):
+        """
+        Returns the ManifestEntry of the archives other than source extracted
+        to target with the given content key, most recent first.
+        """
+        return [
+            ManifestEntry(*row) for row in self._db.execute(
+                'SELECT manifest.* FROM content JOIN manifest '
+                'USING (source, target) WHERE content_key = ? '
+                'AND NOT (source = ? AND target = ?) '
+                'ORDER BY manifest.updated DESC',
+                (content_key, source, target)
+            )
+        ]
+
+    def forget(self, torrent_id, source=None):
+        """
+        Removes the jobs of a torrent, or a single one of its jobs. The
+        marker and manifest of the torrent go along with all its jobs.
+        """
+        with self._db:
+            if source is None:
+                self._db.execute(
+                    'DELETE FROM jobs WHERE torrent_id = ?', (torrent_id,)
+                )
+                self._db.execute(
+                    'DELETE FROM torrents WHERE torrent_id = ?', (torrent_id,)
+                )
+                self._db.execute(
+                    'DELETE FROM manifest WHERE torrent_id = ?', (torrent_id,)
+                )
+                self._db.execute(
+                    'DELETE FROM content WHERE torrent_id = ?', (torrent_id,)
+                )
+            else:
+                self._db.execute(
+                    'DELETE FROM jobs WHERE torrent_id = ? AND source = ?',
+                    (torrent_id, source)
+                )
@@ -0,0 +1,299 @@
+#
+# listing.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import tarfile
+import zipfile
+from collections import OrderedDict
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.protocol import ProcessProtocol
+from twisted.internet.threads import deferToThread
+
+from . import engine
+from .process import MAX_LINE_LENGTH
+
+log = logging.getLogger(__name__)
+
+# Number of archive listings kept by ArchiveLister.
+CACHE_SIZE = 256
+# Number of entries, over all listings, kept by ArchiveLister. Bigger
+# listings are not cached at all.
+CACHE_MAX_ENTRIES = 100000
+
+
+class ArchiveEntry(object):
+    """A file in an archive listing, name relative to the extraction target."""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    def __repr__(self):
+        return 'ArchiveEntry(%r, %d)' % (self.name, self.size)
+
+
+class ArchiveLister(object):
+    """
+    Lists the files of archives without extracting them, with the tool that
+    extracts them. Listings are cached on the path, size and modification time
+    of the archive, so an archive is listed once however many times its
+    listing is needed.
+
+    Only archives that can be listed without decompressing them are listed:
+    rar, 7z, zip and uncompressed tar archives. The listing of any other
+    archive is None.
+
+    The output of unrar and 7z is parsed as it arrives, only the entries are
+    kept. The cache holds at most `cache_size` listings and `max_entries`
+    entries.
+    """
+
+    def __init__(self, cache_size=CACHE_SIZE, max_entries=CACHE_MAX_ENTRIES):
+        self.cache_size = cache_size
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._cached_entries = 0
+
+    def list(self, command, source):
+        """
+        Returns a Deferred firing with the list of ArchiveEntry of the archive
+        source extracted by command, or None when it cannot be listed.
+        """
+        d = deferToThread(_cache_key, source)
+        d.addCallback(self._on_cache_key, command, source)
+        return d
+
+    def _on_cache_key(self, key, command, source):
+        if key is None:
+            return None
+
+        if key in self._cache:
+            self._cache[key] = self._cache.pop(key)
+            return self._cache[key]
+
+        d = self._list(command, source)
+        d.addCallback(self._on_listed, key, source)
+        return d
+
+    def _list(self, command, source):
+        tool = os.path.splitext(os.path.basename(command[0]))[0].lower()
+        lowered = source.lower()
+
+        if tool == 'unrar':
+            return spawn_lister(
+                command[0], ['lt', '-v', '-p-', source], UnrarListingParser()
+            )
+        if tool in ('7z', '7zr', '7za'):
+            return spawn_lister(
+                command[0], ['l', '-slt', '-p-', source], SevenZipListingParser()
+            )
+        if lowered.endswith(tuple(engine.ZIP_EXTENSIONS)):
+            return deferToThread(list_zip, source)
+        if lowered.endswith('.tar'):
+            return deferToThread(list_tar, source)
+        return succeed(None)
+
+    def _on_listed(self, entries, key, source):
+        if entries is None:
+            log.debug('Could not list %s', source)
+            return None
+
+        if len(entries) > self.max_entries:
+            return entries
+
+        self._cache[key] = entries
+        self._cached_entries += len(entries)
+        while len(self._cache) > self.cache_size or \
+                self._cached_entries > self.max_entries:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_entries -= len(evicted)
+        return entries
+
+
+def _cache_key(source):
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return None
+    return source, stat.st_size, stat.st_mtime
+
+
+class ListingProcessProtocol(ProcessProtocol):
+    """
+    Feeds the output of a listing process to a parser line by line, as it
+    arrives. `deferred` fires with the entries of the parser, or None when
+    the process fails.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.deferred = Deferred()
+        self._partial = b''
+
+    def connectionMade(self):
+        self.transport.closeStdin()
+
+    def outReceived(self, data):
+        lines = (self._partial + data).split(b'\n')
+        self._partial = lines.pop()[-MAX_LINE_LENGTH:]
+        for line in lines:
+            self.parser.feed(line.decode('utf-8', 'replace'))
+
+    def processEnded(self, reason):
+        if self._partial:
+            self.parser.feed(self._partial.decode('utf-8', 'replace'))
+            self._partial = b''
+
+        if reason.value.exitCode != 0:
+            self.deferred.callback(None)
+        else:
+            self.deferred.callback(self.parser.entries)
+
+
+def spawn_lister(executable, args, parser):
+    """
+    Runs a listing process and returns a Deferred firing with the entries
+    parser found in its output, or None when it fails.
+    """
+    protocol = ListingProcessProtocol(parser)
+    reactor.spawnProcess(
+        protocol,
+        executable,
+        [executable] + list(args),
+        env=os.environ,
+    )
+    return protocol.deferred
+
+
+class UnrarListingParser(object):
+    """Parses the output of `unrar lt` line by line."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._name = None
+        self._is_file = True
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition(': ')
+        if not sep:
+            return
+        if key == 'Name':
+            self._name = value
+            self._is_file = True
+        elif key == 'Type' and self._name is not None:
+            self._is_file = value == 'File'
+        elif key == 'Size' and self._name is not None and self._is_file:
+            # Files split over volumes are listed in each of them.
+            size = int(value)
+            self._entries[self._name] = max(
+                size, self._entries.get(self._name, 0)
+            )
+
+    @property
+    def entries(self):
+        return [
+            ArchiveEntry(name, size) for name, size in self._entries.items()
+        ]
+
+
+class SevenZipListingParser(object):
+    """Parses the output of `7z l -slt` line by line."""
+
+    def __init__(self):
+        self._entries = []
+        # The properties of the archive itself come before the separator.
+        self._props = None
+
+    def feed(self, line):
+        line = line.rstrip('\r\n')
+        if self._props is None:
+            if line.startswith('----------'):
+                self._props = {}
+            return
+
+        if not line.strip():
+            self._add_entry()
+        elif ' = ' in line:
+            key, value = line.split(' = ', 1)
+            self._props[key] = value
+
+    def _add_entry(self):
+        props = self._props
+        if not props:
+            return
+        self._props = {}
+
+        if 'Path' not in props or props.get('Folder') == '+':
+            return
+        if 'D' in props.get('Attributes', '').split(' ')[0]:
+            return
+        self._entries.append(
+            ArchiveEntry(props['Path'], int(props.get('Size') or 0))
+        )
+
+    @property
+    def entries(self):
+        if self._props is not None:
+            self._add_entry()
+        return self._entries
+
+
+def list_zip(source):
+    try:
+        with zipfile.ZipFile(source) as archive:
+            return [
+                ArchiveEntry(member.filename, member.file_size)
+                for member in archive.infolist()
+                if not member.filename.endswith('/')
+            ]
+    except (IOError, OSError, zipfile.BadZipfile):
+        return None
+
+
+def list_tar(source):
+    try:
+        with tarfile.open(source, 'r:') as archive:
+            return [
+                ArchiveEntry(member.name, member.size)
+                for member in archive.getmembers()
+                if member.isfile()
+            ]
+    except (IOError, OSError, tarfile.TarError):
+        return None
@@ -0,0 +1,142 @@
+#
+# members.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+
+from __future__ import unicode_literals
+
+import fnmatch
+import os
+import posixpath
+
+# Exit codes of extractors that found no member to extract, which is not an
+# error when every member is filtered out.
+NO_MATCH_EXIT_CODES = {
+    'unrar': 10,
+    'unzip': 11,
+}
+
+
+def tool_name(command):
+    """Returns the name of the program of an extract command, e.g. `7z`."""
+    return os.path.splitext(os.path.basename(command[0]))[0].lower()
+
+
+class MemberFilter(object):
+    """
+    Include and exclude glob patterns for the members of an archive.
+
+    A member is extracted when it matches one of the include patterns, or
+    there are none, and none of the exclude patterns. Patterns are matched
+    case-sensitively against the path of the member in the archive and
+    against its file name, so `*.nfo` matches in every folder.
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = list(include)
+        self.exclude = list(exclude)
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    __nonzero__ = __bool__  # For Python 2.
+
+    def matches(self, name):
+        name = name.replace('\\', '/').strip('/')
+        names = (name, posixpath.basename(name))
+        if self.include and not self._match_any(names, self.include):
+            return False
+        return not self._match_any(names, self.exclude)
+
+    @staticmethod
+    def _match_any(names, patterns):
+        return any(
+            fnmatch.fnmatchcase(name, pattern)
+            for name in names for pattern in patterns
+        )
+
+    def filter_entries(self, entries):
+        """Returns the listing entries of the members that are extracted."""
+        if entries is None or not self:
+            return entries
+        return [entry for entry in entries if self.matches(entry.name)]
+
+    def arguments(self, command):
+        """
+        Returns the arguments passing the patterns to the extractor of
+        command, as a tuple of those going before and after the archive.
+        """
+        tool = tool_name(command)
+        if tool == 'unrar':
+            return ['-n' + pattern for pattern in self.include] + \
+                ['-x' + pattern for pattern in self.exclude], []
+
+        if tool in ('7z', '7zr', '7za'):
+            return ['-ir!' + pattern for pattern in self.include] + \
+                ['-xr!' + pattern for pattern in self.exclude], []
+
+        if tool == 'unzip':
+            # unzip matches the whole path, with wildcards crossing folders.
+            after = self._in_any_folder(self.include)
+            if self.exclude:
+                after += ['-x'] + self._in_any_folder(self.exclude)
+            return [], after
+
+        if tool == 'tar':
+            # Include patterns are left out, tar fails when one of them
+            # matches nothing. Tarballs are extracted in-process instead
+            # when there are any.
+            return [], ['--exclude=' + pattern for pattern in self.exclude]
+
+        return [], []
+
+    @staticmethod
+    def _in_any_folder(patterns):
+        args = []
+        for pattern in patterns:
+            args.append(pattern)
+            if '/' not in pattern:
+                args.append('*/' + pattern)
+        return args
+
+    def check_exit(self, result, command):
+        """
+        Turns the exit code of an extractor that found no member matching the
+        patterns into a success.
+        """
+        exit_code, output = result
+        if self and exit_code and \
+                exit_code == NO_MATCH_EXIT_CODES.get(tool_name(command)):
+            return 0, output
+        return result
@@ -0,0 +1,346 @@
+#
+# metrics.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+
+from __future__ import unicode_literals
+
+import logging
+from collections import Counter
+
+from twisted.internet import reactor, task
+from twisted.internet.error import CannotListenError
+from twisted.internet.threads import deferToThread
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from . import fileops
+
+log = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the buckets of the time histograms.
+TIME_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+# Seconds between two writes of the metrics file.
+WRITE_INTERVAL = 15
+# The metrics endpoint is for a scraper on the same host only.
+LISTEN_ADDRESS = '127.0.0.1'
+CONTENT_TYPE = b'text/plain; version=0.0.4; charset=utf-8'
+
+# State of the jobs skipped because their archive was already extracted.
+JOB_SKIPPED = 'skipped'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, ('%s' % value).replace('\\', '\\\\')
+                     .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return '%d' % value
+
+
+class Histogram(object):
+    """Counts observed values into buckets of increasing upper bounds."""
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def add(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+    def cumulative(self):
+        """Returns (upper bound, count of values up to it) pairs."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def get_status(self):
+        return {
+            'buckets': [[bound, count] for bound, count in self.cumulative()],
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class FormatStats(object):
+    """The counters and timings of the extractions of one archive format."""
+
+    def __init__(self):
+        self.jobs = Counter()
+        self.exit_codes = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.queued_time = Histogram()
+        self.run_time = Histogram()
+
+    def add(self, other):
+        self.jobs.update(other.jobs)
+        self.exit_codes.update(other.exit_codes)
+        self.bytes_in += other.bytes_in
+        self.bytes_out += other.bytes_out
+        self.queued_time.add(other.queued_time)
+        self.run_time.add(other.run_time)
+
+    @property
+    def throughput(self):
+        """Bytes written per second of extraction."""
+        if not self.run_time.sum:
+            return 0.0
+        return self.bytes_out / self.run_time.sum
+
+    def get_status(self):
+        return {
+            'jobs': dict(self.jobs),
+            'exit_codes': dict(
+                ('%d' % code, count)
+                for code, count in self.exit_codes.items()
+            ),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'throughput': self.throughput,
+            'queued_time': self.queued_time.get_status(),
+            'run_time': self.run_time.get_status(),
+        }
+
+
+class ExtractMetrics(object):
+    """
+    Aggregates the extraction jobs by archive format: how many ended in each
+    state and with each exit code, the bytes they read and wrote, and
+    histograms of the time they waited in the queue and took to run.
+
+    Jobs skipped because their archive was already extracted are counted,
+    but do not add to the bytes or the run time.
+    """
+
+    def __init__(self):
+        self.formats = {}
+
+    def record(self, archive_format, status, exit_code, queued_time,
+               run_time, bytes_in, bytes_out):
+        stats = self.formats.get(archive_format)
+        if stats is None:
+            stats = self.formats[archive_format] = FormatStats()
+
+        stats.jobs[status] += 1
+        stats.exit_codes[exit_code] += 1
+        if queued_time is not None:
+            stats.queued_time.observe(max(0.0, queued_time))
+        if status == JOB_SKIPPED:
+            return
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+        if run_time is not None:
+            stats.run_time.observe(max(0.0, run_time))
+
+    def total(self):
+        total = FormatStats()
+        for stats in self.formats.values():
+            total.add(stats)
+        return total
+
+    def get_stats(self, queued=0, running=0):
+        return {
+            'queued': queued,
+            'running': running,
+            'total': self.total().get_status(),
+            'formats': dict(
+                (archive_format, stats.get_status())
+                for archive_format, stats in self.formats.items()
+            ),
+        }
+
+    def to_prometheus(self, queued=0, running=0):
+        """Returns the metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append('# HELP pvrextractor_%s %s' % (name, help_text))
+            lines.append('# TYPE pvrextractor_%s %s' % (name, kind))
+            for suffix, labels, value in samples:
+                lines.append('pvrextractor_%s%s%s %s' % (
+                    name, suffix, format_labels(labels), format_value(value)
+                ))
+
+        formats = sorted(self.formats.items())
+        metric('jobs_queued', 'gauge', 'Extractions waiting to run.',
+               [('', (), queued)])
+        metric('jobs_running', 'gauge', 'Extractions running.',
+               [('', (), running)])
+        metric('jobs_total', 'counter', 'Extractions ended, by state.', [
+            ('', (('format', name), ('status', status)), count)
+            for name, stats in formats
+            for status, count in sorted(stats.jobs.items())
+        ])
+        metric('exit_codes_total', 'counter',
+               'Extractions ended, by exit code.', [
+                   ('', (('format', name), ('code', code)), count)
+                   for name, stats in formats
+                   for code, count in sorted(stats.exit_codes.items())
+               ])
+        metric('bytes_in_total', 'counter', 'Bytes of archives extracted.', [
+            ('', (('format', name),), stats.bytes_in)
+            for name, stats in formats
+        ])
+        metric('bytes_out_total', 'counter', 'Bytes extracted.', [
+            ('', (('format', name),), stats.bytes_out)
+            for name, stats in formats
+        ])
+        for attr, help_text in (
+            ('queued_time', 'Seconds extractions waited in the queue.'),
+            ('run_time', 'Seconds extractions took to run.'),
+        ):
+            samples = []
+            for name, stats in formats:
+                histogram = getattr(stats, attr)
+                for bound, count in histogram.cumulative():
+                    samples.append(
+                        ('_bucket', (('format', name), ('le', bound)), count)
+                    )
+                samples.append(('_sum', (('format', name),), histogram.sum))
+                samples.append(
+                    ('_count', (('format', name),), histogram.count)
+                )
+            metric(attr.replace('_time', '_seconds'), 'histogram', help_text,
+                   samples)
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, render):
+        Resource.__init__(self)
+        self._render = render
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', CONTENT_TYPE)
+        return self._render().encode('utf-8')
+
+
+class MetricsExporter(object):
+    """
+    Makes the text returned by render available to Prometheus, written to a
+    file every interval seconds for the node exporter textfile collector,
+    and served at /metrics on a port of the loopback interface.
+    """
+
+    def __init__(self, render, interval=WRITE_INTERVAL):
+        self.render = render
+        self.interval = interval
+        self.path = ''
+        self.port = 0
+        self._writer = task.LoopingCall(self._write)
+        self._writing = False
+        self._listener = None
+
+    def configure(self, path, port):
+        if path != self.path:
+            if self._writer.running:
+                self._writer.stop()
+            self.path = path
+            if path:
+                self._writer.start(self.interval)
+
+        if port != self.port:
+            if self._listener is not None:
+                self._listener.stopListening()
+                self._listener = None
+            self.port = port
+            if port:
+                self._listen(port)
+
+    def stop(self):
+        self.configure('', 0)
+
+    def _listen(self, port):
+        root = Resource()
+        root.putChild(b'metrics', MetricsResource(self.render))
+        site = Site(root)
+        site.noisy = False
+        try:
+            self._listener = reactor.listenTCP(
+                port, site, interface=LISTEN_ADDRESS
+            )
+        except CannotListenError as ex:
+            log.error('Could not serve the metrics on port %d: %s', port, ex)
+        else:
+            log.info('Serving metrics on http://%s:%d/metrics',
+                     LISTEN_ADDRESS, port)
+
+    def _write(self):
+        # The file may be on a slow mount, a write still going is not
+        # queued behind.
+        if self._writing:
+            return
+        self._writing = True
+        d = deferToThread(
+            fileops.write_file, self.path, self.render().encode('utf-8')
+        )
+        d.addErrback(
+            lambda failure: log.warning(
+                'Could not write the metrics to %s: %s',
+                self.path,
+                failure.getErrorMessage(),
+            )
+        )
+        d.addBoth(self._on_written)
+
+    def _on_written(self, result):
+        self._writing = False
@@ -0,0 +1,241 @@
+#
+# notifier.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+
+from __future__ import unicode_literals
+
+import json
+import logging
+from collections import OrderedDict
+from io import BytesIO
+
+from twisted.internet import reactor
+from twisted.web.client import (
+    Agent,
+    FileBodyProducer,
+    HTTPConnectionPool,
+    readBody,
+)
+from twisted.web.http_headers import Headers
+
+log = logging.getLogger(__name__)
+
+# Seconds notifications are collected for before they are sent, so a batch
+# of torrents finishing together is sent in one go.
+BATCH_DELAY = 5
+# Minimum seconds between two requests to the same server.
+MIN_INTERVAL = 1
+# Seconds before a request is abandoned.
+REQUEST_TIMEOUT = 30
+
+SCAN_COMMANDS = {
+    'sonarr': 'DownloadedEpisodesScan',
+    'radarr': 'DownloadedMoviesScan',
+}
+
+
+class PVRServer(object):
+    """A Sonarr or Radarr instance notified of the torrents of some labels."""
+
+    def __init__(self, kind, url, api_key, labels=()):
+        if kind not in SCAN_COMMANDS:
+            raise ValueError('Unknown PVR type %s' % kind)
+        self.kind = kind
+        self.url = url.rstrip('/')
+        self.api_key = api_key
+        self.labels = list(labels)
+        self.queue = OrderedDict()
+        self.call = None
+        self.sending = False
+        # Bumped when the pending sends are cancelled, so the requests still
+        # in flight then do not schedule the next one.
+        self.generation = 0
+
+    def handles(self, label):
+        return not self.labels or label in self.labels
+
+    @property
+    def command_url(self):
+        return self.url + '/api/v3/command'
+
+
+class PVRNotifier(object):
+    """
+    Tells Sonarr and Radarr to import a torrent as soon as its extractions
+    are complete, instead of waiting for their next poll of the daemon.
+
+    Notifications are collected for batch_delay seconds, then sent to every
+    server one after the other, no closer than min_interval seconds apart,
+    over persistent connections. A torrent notified again before it is sent
+    is only sent once.
+    """
+
+    def __init__(self, batch_delay=BATCH_DELAY, min_interval=MIN_INTERVAL,
+                 clock=reactor):
+        self.batch_delay = batch_delay
+        self.min_interval = min_interval
+        self.clock = clock
+        self.servers = []
+        self.pool = HTTPConnectionPool(clock, persistent=True)
+        self.pool.maxPersistentPerHost = 1
+        self.agent = Agent(clock, connectTimeout=REQUEST_TIMEOUT,
+                           pool=self.pool)
+        self._config = None
+
+    def configure(self, servers):
+        """
+        Sets the servers from a list of dicts with their `type`, `sonarr` or
+        `radarr`, `url`, `api_key` and comma separated `labels`. Queued
+        notifications are dropped when the servers change.
+        """
+        if servers == self._config:
+            return
+
+        self._cancel_calls()
+        self._config = [dict(server) for server in servers
+                        if isinstance(server, dict)]
+        self.servers = []
+        for server in servers:
+            try:
+                self.servers.append(PVRServer(
+                    server.get('type', ''),
+                    server['url'],
+                    server.get('api_key', ''),
+                    [label.strip() for label in
+                     server.get('labels', '').split(',') if label.strip()],
+                ))
+            except (KeyError, ValueError, AttributeError) as ex:
+                log.error('Ignoring invalid PVR server %s: %s', server, ex)
+
+    def stop(self):
+        self._cancel_calls()
+        for server in self.servers:
+            server.queue.clear()
+        return self.pool.closeCachedConnections()
+
+    def _cancel_calls(self):
+        for server in self.servers:
+            if server.call is not None and server.call.active():
+                server.call.cancel()
+            server.call = None
+            server.sending = False
+            server.generation += 1
+
+    def notify(self, torrent_id, path, label=''):
+        """Queues an import of the torrent extracted to path."""
+        for server in self.servers:
+            if not server.handles(label):
+                continue
+            if server.call is None and not server.sending:
+                server.call = self.clock.callLater(
+                    self.batch_delay, self._send_next, server
+                )
+            server.queue[torrent_id] = path
+
+    def _send_next(self, server):
+        server.call = None
+        if not server.queue:
+            server.sending = False
+            return
+
+        server.sending = True
+        torrent_id, path = server.queue.popitem(last=False)
+        d = self._send(server, torrent_id, path)
+        d.addBoth(self._on_sent, server, server.generation)
+
+    def _on_sent(self, result, server, generation):
+        if generation == server.generation and server in self.servers:
+            server.call = self.clock.callLater(
+                self.min_interval, self._send_next, server
+            )
+
+    def _send(self, server, torrent_id, path):
+        body = json.dumps({
+            'name': SCAN_COMMANDS[server.kind],
+            'path': path,
+            'downloadClientId': torrent_id.upper(),
+        }).encode('utf-8')
+        headers = Headers({
+            b'Content-Type': [b'application/json'],
+            b'X-Api-Key': [server.api_key.encode('utf-8')],
+        })
+
+        d = self.agent.request(
+            b'POST',
+            server.command_url.encode('utf-8'),
+            headers,
+            FileBodyProducer(BytesIO(body)),
+        )
+        timeout = self.clock.callLater(REQUEST_TIMEOUT, d.cancel)
+        d.addBoth(self._cancel_timeout, timeout)
+        d.addCallback(self._on_response, server, torrent_id)
+        d.addErrback(
+            lambda failure: log.warning(
+                '[%s] Could not notify %s at %s: %s',
+                torrent_id,
+                server.kind,
+                server.url,
+                failure.getErrorMessage(),
+            )
+        )
+        return d
+
+    @staticmethod
+    def _cancel_timeout(result, timeout):
+        if timeout.active():
+            timeout.cancel()
+        return result
+
+    @staticmethod
+    def _on_response(response, server, torrent_id):
+        # The body is always read, the connection only goes back to the pool
+        # once it is.
+        d = readBody(response)
+
+        def on_body(body):
+            if 200 <= response.code < 300:
+                log.info('[%s] Notified %s at %s', torrent_id, server.kind,
+                         server.url)
+            else:
+                log.warning(
+                    '[%s] %s at %s refused the notification with HTTP %d: %s',
+                    torrent_id,
+                    server.kind,
+                    server.url,
+                    response.code,
+                    body[:200].decode('utf-8', 'replace'),
+                )
+
+        return d.addCallback(on_body)
@@ -0,0 +1,104 @@
+#
+# pipeline.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import shutil
+import tempfile
+
+log = logging.getLogger(__name__)
+
+LINK_DIR_PREFIX = 'pvrextractor-'
+
+
+class VolumePipeline(object):
+    """
+    Extracts a multi-volume rar set while the torrent is still downloading.
+    volumes is the list of torrent file index and path of every volume.
+
+    Volumes that have not finished downloading already exist on disk, so
+    unrar is pointed at a directory of symlinks holding only the completed
+    volumes. When unrar asks for a volume that is not there yet, the prompt
+    is answered as soon as that volume completes. link_dir is the directory
+    of those symlinks, see make_link_dir.
+    """
+
+    def __init__(self, job, volumes, link_dir):
+        self.job = job
+        self.volumes = volumes
+        self.protocol = None
+        self.result = None
+        self.link_dir = link_dir
+
+    @property
+    def first_volume(self):
+        return self.link_path(self.job.source)
+
+    def link_path(self, path):
+        return os.path.join(self.link_dir, os.path.basename(path))
+
+    def add_volume(self, path):
+        """Makes a completed volume available to unrar."""
+        link_path = self.link_path(path)
+        if not os.path.lexists(link_path):
+            log.debug('[%s] Volume ready: %s', self.job.torrent_id, path)
+            os.symlink(path, link_path)
+
+        if self.protocol and self.protocol.next_volume:
+            self.on_next_volume(self.protocol.next_volume)
+
+    def add_completed_volumes(self, file_progress):
+        """Adds every volume of the set that has been fully downloaded."""
+        for index, path in self.volumes:
+            if file_progress[index] >= 1.0:
+                self.add_volume(path)
+
+    def on_next_volume(self, name):
+        if os.path.exists(self.link_path(name)):
+            self.protocol.continue_next_volume()
+        else:
+            log.debug(
+                '[%s] Waiting for volume %s', self.job.torrent_id, name
+            )
+
+    def cleanup(self):
+        shutil.rmtree(self.link_dir, ignore_errors=True)
+
+
+def make_link_dir():
+    """Creates the directory of the volume symlinks of a VolumePipeline."""
+    return tempfile.mkdtemp(prefix=LINK_DIR_PREFIX)
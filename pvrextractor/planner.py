@@ -0,0 +1,201 @@
+#
+# planner.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+
+from __future__ import unicode_literals
+
+from .members import tool_name
+from .rarcheck import NEW_VOLUME_RE
+
+# Tools able to join split volumes while extracting them.
+SPLIT_VOLUME_TOOLS = ('7z', '7za', '7zr')
+
+RAR_EXTENSION = '.rar'
+# Kind of the `name.7z.001`, `name.zip.002`, ... volumes split with 7-Zip or
+# split.
+SPLIT_VOLUMES = '.NNN'
+
+
+class ExtensionIndex(object):
+    """
+    Finds the extract command of a file name from its longest extension with
+    a command, e.g. `.tar.gz` before `.gz`, with one dictionary lookup per
+    dot in the name up to the most dots of an extension. Extensions match
+    case-insensitively.
+    """
+
+    def __init__(self, commands):
+        self.commands = dict(
+            (ext.lower(), command) for ext, command in commands.items()
+        )
+        self.max_dots = max(
+            [ext.count('.') for ext in self.commands] or [0]
+        )
+
+    def find(self, name):
+        """Returns the extension and command of a file name, or None, None."""
+        name = name.lower()
+        starts = []
+        pos = len(name)
+        for _ in range(self.max_dots):
+            pos = name.rfind('.', 0, pos)
+            # A leading dot starts a hidden name, not an extension.
+            if pos <= 0:
+                break
+            starts.append(pos)
+
+        for pos in reversed(starts):
+            command = self.commands.get(name[pos:])
+            if command is not None:
+                return name[pos:], command
+        return None, None
+
+    def find_command(self, name):
+        """
+        Returns the command extracting the file name, which is None for the
+        volumes of a multi-volume archive but its first one.
+        """
+        volume = find_volume(name)
+        if volume is not None:
+            return self.volume_command(*volume)
+        return self.find(name)[1]
+
+    def volume_command(self, kind, root, number):
+        if number != 1:
+            return None
+        if kind == RAR_EXTENSION:
+            return self.commands.get(RAR_EXTENSION)
+
+        # Split volumes are joined by 7-Zip, when it extracts their format.
+        command = self.find(root)[1]
+        if command and tool_name(command) in SPLIT_VOLUME_TOOLS:
+            return command
+        return None
+
+
+def find_volume(name):
+    """
+    Returns the kind, root and number of the volume of a multi-volume archive
+    from its file name, or None for any other file. The kind is `.rar` for
+    `name.partN.rar` and `name.rar`, `name.r00`, ... volumes, and `.NNN` for
+    split volumes.
+    """
+    # Most files are not volumes, their extension rules out a volume before
+    # any regular expression is run.
+    dot = name.rfind('.')
+    if dot <= 0:
+        return None
+    ext = name[dot:].lower()
+
+    if ext == RAR_EXTENSION:
+        match = NEW_VOLUME_RE.match(name)
+        if match:
+            return RAR_EXTENSION, match.group(1).lower(), int(match.group(2))
+        return RAR_EXTENSION, name[:dot].lower(), 1
+
+    if len(ext) == 4 and ext[2:].isdigit():
+        if 'r' <= ext[1] <= 'z':
+            # .r00 to .r99 then .s00 and so on follow the .rar volume.
+            number = 2 + (ord(ext[1]) - ord('r')) * 100 + int(ext[2:])
+            return RAR_EXTENSION, name[:dot].lower(), number
+        if ext[1].isdigit():
+            return SPLIT_VOLUMES, name[:dot].lower(), int(ext[1:])
+    return None
+
+
+class PlannedArchive(object):
+    """An archive of a torrent to extract and the files of its volumes."""
+
+    def __init__(self, file, command, volumes):
+        self.path = file['path']
+        self.index = file['index']
+        self.command = command
+        self.volumes = volumes
+        self.size = sum(volume['size'] for volume in volumes)
+
+
+class TorrentPlan(object):
+    """
+    What to do with the files of a torrent: the archives to extract, in the
+    order of the torrent, and the files that are neither archives nor volumes
+    of one. unsupported counts the archives and volume sets without a
+    command or a first volume.
+    """
+
+    def __init__(self):
+        self.archives = []
+        self.other_files = []
+        self.unsupported = 0
+
+
+def plan_torrent(files, index):
+    """
+    Plans the extraction of a torrent from the file dicts of get_files in a
+    single pass, grouping the volumes of multi-volume archives into a single
+    archive extracted from its first volume.
+    """
+    plan = TorrentPlan()
+    sets = {}
+    singles = []
+
+    for file in files:
+        directory, _, name = file['path'].replace('\\', '/').rpartition('/')
+        volume = find_volume(name)
+        if volume is not None:
+            kind, root, number = volume
+            sets.setdefault((directory, kind, root), []).append(
+                (number, file)
+            )
+            continue
+
+        command = index.find(name)[1]
+        if command is None:
+            plan.other_files.append(file['path'])
+        else:
+            singles.append(PlannedArchive(file, command, [file]))
+
+    for (directory, kind, root), volumes in sets.items():
+        volumes.sort(key=lambda volume: volume[0])
+        number, first = volumes[0]
+        command = index.volume_command(kind, root, number)
+        if command is None:
+            plan.unsupported += 1
+            continue
+        singles.append(PlannedArchive(
+            first, command, [file for number, file in volumes]
+        ))
+
+    plan.archives = sorted(singles, key=lambda archive: archive.index)
+    return plan
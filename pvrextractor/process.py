@@ -0,0 +1,286 @@
+#
+# process.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import re
+import signal
+import time
+from collections import deque
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.error import ProcessExitedAlready
+from twisted.internet.protocol import ProcessProtocol
+from twisted.python.procutils import which
+
+log = logging.getLogger(__name__)
+
+TAIL_LINES = 20
+MAX_LINE_LENGTH = 4096
+# Seconds between asking a process to terminate and killing it.
+KILL_GRACE = 10
+
+# Runs the extractor in its own process group, so it can be killed along
+# with the decompressors it starts.
+SETSID = (which('setsid') or [None])[0]
+NICE = (which('nice') or [None])[0]
+IONICE = (which('ionice') or [None])[0]
+
+IONICE_CLASSES = {
+    'realtime': '1',
+    'best-effort': '2',
+    'idle': '3',
+}
+
+# Moves the shell into the cgroup given as $0 then replaces it with the
+# command, so the command and all its children run in the cgroup.
+CGROUP_SHIM = 'echo $$ > "$0/cgroup.procs" || ' \
+    'echo "Could not join cgroup $0" >&2; exec "$@"'
+
+# unrar and 7z redraw their progress in place with backspaces or carriage
+# returns, so those are line breaks as far as the tail is concerned.
+LINE_BREAK_RE = re.compile(r'[\r\n\b]+')
+PERCENT_RE = re.compile(r'(\d{1,3})%')
+# Asked by unrar when it cannot open the next volume of a set and -y is not
+# given. It waits for an answer on stdin.
+NEXT_VOLUME_RE = re.compile(
+    r'(?:Insert disk with|Cannot find volume)\s+(.+?)\s*(?:\[C\]ontinue.*)?$'
+)
+CONTINUE_PROMPT_RE = re.compile(r'\[C\]ontinue')
+
+
+class ExtractProcessProtocol(ProcessProtocol):
+    """
+    Streams the output of an extractor process.
+
+    Nothing but the last `tail_lines` lines of output is kept, so memory use
+    does not depend on the number of members in the archive. Percentages
+    printed by the extractor are reported to `on_progress` as they arrive.
+
+    When `on_next_volume` is given, it is called with the name of the missing
+    volume when unrar prompts for it, and the prompt is left pending until
+    `continue_next_volume` is called.
+
+    `deferred` fires with a tuple of the exit code and the output tail once the
+    process has ended. `last_activity` is the time output was last received.
+    """
+
+    def __init__(self, tail_lines=TAIL_LINES, on_progress=None,
+                 on_next_volume=None):
+        self.deferred = Deferred()
+        self.on_progress = on_progress
+        self.on_next_volume = on_next_volume
+        self.progress = None
+        self.next_volume = None
+        self.process_group = False
+        self.last_activity = time.time()
+        self.ended = False
+
+        self._tail = deque(maxlen=tail_lines)
+        self._partial = ''
+        self._pid = None
+        self._kill_call = None
+
+    def connectionMade(self):
+        self._pid = self.transport.pid
+
+        # Nothing is ever typed into an extractor except the answer to a next
+        # volume prompt, any other prompt gets end of file instead of hanging.
+        if self.on_next_volume is None:
+            self.transport.closeStdin()
+
+    def outReceived(self, data):
+        self._on_data(data)
+
+    def errReceived(self, data):
+        self._on_data(data)
+
+    def processEnded(self, reason):
+        self.ended = True
+        if self._kill_call is not None and self._kill_call.active():
+            self._kill_call.cancel()
+
+        self._add_line(self._partial)
+        self._partial = ''
+
+        exit_code = reason.value.exitCode
+        if exit_code is None:
+            # Killed by a signal, report it the way a shell would.
+            exit_code = 128 + (reason.value.signal or 0)
+
+        self.deferred.callback((exit_code, self.output))
+
+    @property
+    def output(self):
+        return '\n'.join(self._tail)
+
+    def terminate(self, grace=KILL_GRACE):
+        """
+        Asks the process and everything it started to terminate, and kills
+        them if they are still there after grace seconds.
+        """
+        self._signal('TERM')
+        if self._kill_call is None:
+            self._kill_call = reactor.callLater(grace, self._signal, 'KILL')
+
+    def _signal(self, name):
+        if self.ended or self._pid is None:
+            return
+
+        try:
+            if self.process_group:
+                os.killpg(self._pid, getattr(signal, 'SIG' + name))
+            else:
+                self.transport.signalProcess(name)
+        except (OSError, ProcessExitedAlready):
+            pass
+
+    def _on_data(self, data):
+        self.last_activity = time.time()
+        text = self._partial + data.decode('utf-8', 'replace')
+        lines = LINE_BREAK_RE.split(text)
+        self._partial = lines.pop()[-MAX_LINE_LENGTH:]
+
+        for line in lines:
+            self._add_line(line)
+
+        # Progress and prompts are printed without a trailing line break.
+        self._parse_progress(self._partial)
+        self._parse_next_volume(self._partial)
+        if self.next_volume and CONTINUE_PROMPT_RE.search(self._partial):
+            self._partial = ''
+            if self.on_next_volume:
+                self.on_next_volume(self.next_volume)
+
+    def continue_next_volume(self):
+        """Answers a pending next volume prompt once the volume is there."""
+        if self.next_volume:
+            self.next_volume = None
+            self.transport.write(b'C\n')
+
+    def _add_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+
+        if self._parse_progress(line) and not PERCENT_RE.sub('', line).strip():
+            # Progress only lines are not interesting in the error log.
+            return
+
+        self._parse_next_volume(line)
+
+        self._tail.append(line[:MAX_LINE_LENGTH])
+
+    def _parse_next_volume(self, text):
+        match = NEXT_VOLUME_RE.search(text)
+        if match and self.on_next_volume:
+            self.next_volume = match.group(1)
+
+    def _parse_progress(self, text):
+        matches = PERCENT_RE.findall(text)
+        if not matches:
+            return False
+
+        progress = min(100, int(matches[-1]))
+        if progress != self.progress:
+            self.progress = progress
+            if self.on_progress:
+                self.on_progress(progress)
+        return True
+
+
+def priority_wrapper(nice_level=0, ionice_class=None, ionice_level=None,
+                     cgroup_path=None):
+    """
+    Returns the command prefix running a command with the given niceness, I/O
+    scheduling class and level and in the given cgroup v2 directory. Settings
+    whose tool is not installed are left out.
+    """
+    wrapper = []
+    if cgroup_path:
+        wrapper += ['/bin/sh', '-c', CGROUP_SHIM, cgroup_path]
+    if nice_level and NICE:
+        wrapper += [NICE, '-n', str(nice_level)]
+    if ionice_class in IONICE_CLASSES and IONICE:
+        # -t runs the command anyway when the class cannot be set, realtime
+        # needs root for instance.
+        wrapper += [IONICE, '-t', '-c', IONICE_CLASSES[ionice_class]]
+        if ionice_class != 'idle' and ionice_level is not None:
+            wrapper += ['-n', str(ionice_level)]
+    return wrapper
+
+
+def spawn_extractor(executable, args, path, env=None, tail_lines=TAIL_LINES,
+                    on_progress=None, on_next_volume=None, wrapper=None):
+    """
+    Runs an extractor process in path and returns its ExtractProcessProtocol,
+    whose deferred fires with a tuple of the exit code and output tail.
+
+    wrapper is a command prefix the extractor is run through, such as the one
+    returned by priority_wrapper. Its commands must exec the extractor.
+    """
+    protocol = ExtractProcessProtocol(tail_lines, on_progress, on_next_volume)
+    argv = list(wrapper or []) + [executable] + list(args)
+    if SETSID:
+        # setsid execs the extractor in place, keeping its pid.
+        argv.insert(0, SETSID)
+        protocol.process_group = True
+
+    reactor.spawnProcess(
+        protocol,
+        argv[0],
+        argv,
+        env=env,
+        path=path,
+    )
+    return protocol
+
+
+def read_process_io(pid):
+    """
+    Returns the I/O counters of a running process from /proc/<pid>/io as a
+    dict, or None on platforms or processes where they are not available.
+    """
+    try:
+        with open('/proc/%d/io' % pid) as io_file:
+            return dict(
+                (key, int(value))
+                for key, value in (line.split(':') for line in io_file)
+            )
+    except (IOError, OSError, ValueError):
+        return None
@@ -0,0 +1,268 @@
+#
+# rarcheck.py
+#
+# Copyright (C) 2017 levic92
+#
+# Deluge is free software.
+#
+# You may redistribute it and/or modify it under the terms of the
+# GNU General Public License, as published by the Free Software
+# Foundation; either version 3 of the License, or (at your option)
+# any later version.
+#
+# deluge is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with deluge.    If not, write to:
+# 	The Free Software Foundation, Inc.,
+# 	51 Franklin Street, Fifth Floor
+# 	Boston, MA  02110-1301, USA.
+#
+#    In addition, as a special exception, the copyright holders give
+#    permission to link the code of portions of this program with the OpenSSL
+#    library.
+#    You must obey the GNU General Public License in all respects for all of
+#    the code used other than OpenSSL. If you modify file(s) with this
+#    exception, you may extend this exception to your version of the file(s),
+#    but you are not obligated to do so. If you do not wish to do so, delete
+#    this exception statement from your version. If you delete this exception
+#    statement from all source files in the program, then also delete it here.
+#
+#
+
+from __future__ import unicode_literals
+
+import os
+import re
+import struct
+
+RAR4_SIGNATURE = b'Rar!\x1a\x07\x00'
+RAR5_SIGNATURE = b'Rar!\x1a\x07\x01\x00'
+
+# RAR 4 block types and flags.
+RAR4_MAIN_HEADER = 0x73
+RAR4_FILE_HEADER = 0x74
+RAR4_END_HEADER = 0x7b
+RAR4_MAIN_ENCRYPTED = 0x0080
+RAR4_LONG_BLOCK = 0x8000
+RAR4_FILE_LARGE = 0x0100
+RAR4_END_NEXT_VOLUME = 0x0001
+
+# RAR 5 header types and flags.
+RAR5_MAIN_HEADER = 1
+RAR5_ENCRYPTION_HEADER = 4
+RAR5_END_HEADER = 5
+RAR5_EXTRA_AREA = 0x0001
+RAR5_DATA_AREA = 0x0002
+RAR5_MAIN_VOLUME_NUMBER = 0x0002
+RAR5_END_NEXT_VOLUME = 0x0001
+
+NEW_VOLUME_RE = re.compile(r'^(.*)\.part(\d+)\.rar$', re.IGNORECASE)
+OLD_VOLUME_RE = re.compile(r'^(.*)\.([r-z])(\d\d)$', re.IGNORECASE)
+
+
+class BrokenSetError(Exception):
+    """Raised for rar archives and volume sets that cannot be extracted."""
+
+
+def is_rar(path):
+    return path.lower().endswith('.rar')
+
+
+def find_volumes(first_volume):
+    """
+    Returns the numbers and paths of the volumes of the set starting at
+    first_volume found next to it, sorted by number. Both the
+    `name.partN.rar` and the `name.rar`, `name.r00`, ... namings are
+    supported, a single archive is a set of one volume.
+    """
+    directory, name = os.path.split(first_volume)
+    match = NEW_VOLUME_RE.match(name)
+    volumes = []
+
+    if match:
+        root = match.group(1).lower()
+        for entry in os.listdir(directory or '.'):
+            entry_match = NEW_VOLUME_RE.match(entry)
+            if entry_match and entry_match.group(1).lower() == root:
+                volumes.append((
+                    int(entry_match.group(2)),
+                    os.path.join(directory, entry),
+                ))
+        return sorted(volumes)
+
+    volumes.append((1, first_volume))
+    root = os.path.splitext(name)[0].lower()
+    for entry in os.listdir(directory or '.'):
+        entry_match = OLD_VOLUME_RE.match(entry)
+        if entry_match and entry_match.group(1).lower() == root:
+            # .r00 to .r99 then .s00 and so on follow the .rar volume.
+            number = 2 + (ord(entry_match.group(2).lower()) - ord('r')) * 100 \
+                + int(entry_match.group(3))
+            volumes.append((number, os.path.join(directory, entry)))
+    return sorted(volumes)
+
+
+def in_set(first_volume, path):
+    """Returns whether path is a volume of the set starting at first_volume."""
+    if os.path.dirname(first_volume) != os.path.dirname(path):
+        return False
+
+    name = os.path.basename(first_volume)
+    match = NEW_VOLUME_RE.match(name)
+    if match:
+        path_match = NEW_VOLUME_RE.match(os.path.basename(path))
+    else:
+        match = re.match(r'^(.*)\.rar$', name, re.IGNORECASE)
+        path_match = OLD_VOLUME_RE.match(os.path.basename(path))
+        if path == first_volume:
+            return True
+
+    return bool(path_match) and \
+        path_match.group(1).lower() == match.group(1).lower()
+
+
+def check_set(first_volume):
+    """
+    Checks that every volume of a rar set is present and starts with valid
+    headers, and that the last volume found really ends the set. Only
+    headers are read, seeking over the packed data.
+
+    Returns the list of volume paths, raises BrokenSetError otherwise.
+    """
+    volumes = find_volumes(first_volume)
+
+    for expected, (number, path) in enumerate(volumes, volumes[0][0]):
+        if number != expected:
+            raise BrokenSetError('Volume %d of %s is missing' % (
+                expected, os.path.basename(first_volume)
+            ))
+
+    last_volume = None
+    for index, (number, path) in enumerate(volumes):
+        last_volume = read_volume(path)
+        if last_volume.number is not None and last_volume.number != index:
+            raise BrokenSetError(
+                '%s is volume %d of its set, expected volume %d' % (
+                    os.path.basename(path), last_volume.number + 1, index + 1
+                )
+            )
+
+    if last_volume.next_volume:
+        raise BrokenSetError('Volumes after %s are missing' % (
+            os.path.basename(volumes[-1][1])
+        ))
+
+    return [path for number, path in volumes]
+
+
+class VolumeInfo(object):
+    """
+    What the headers of a volume tell about its place in the set. number is
+    the 0 based volume number when recorded and next_volume whether another
+    volume follows, None when unknown.
+    """
+
+    def __init__(self, number=None, next_volume=None):
+        self.number = number
+        self.next_volume = next_volume
+
+
+def read_volume(path):
+    try:
+        with open(path, 'rb') as volume:
+            signature = volume.read(len(RAR5_SIGNATURE))
+            if signature == RAR5_SIGNATURE:
+                return _read_rar5(volume, os.fstat(volume.fileno()).st_size)
+            if signature[:len(RAR4_SIGNATURE)] == RAR4_SIGNATURE:
+                volume.seek(len(RAR4_SIGNATURE))
+                return _read_rar4(volume, os.fstat(volume.fileno()).st_size)
+    except (IOError, OSError) as ex:
+        raise BrokenSetError('Cannot read %s: %s' % (
+            os.path.basename(path), ex
+        ))
+    except struct.error:
+        pass
+    else:
+        raise BrokenSetError('%s is not a rar archive' % os.path.basename(path))
+
+    raise BrokenSetError('%s has corrupt headers' % os.path.basename(path))
+
+
+def _read_rar4(volume, size):
+    while True:
+        header = volume.read(7)
+        if not header:
+            # Archives from RAR 2 and earlier have no end of archive block.
+            return VolumeInfo()
+
+        start = volume.tell() - 7
+        crc, block_type, flags, header_size = struct.unpack('<HBHH', header)
+        if header_size < 7:
+            raise struct.error('invalid block size')
+
+        data_size = 0
+        if block_type == RAR4_MAIN_HEADER and flags & RAR4_MAIN_ENCRYPTED:
+            # The file headers are encrypted, nothing more can be read.
+            return VolumeInfo()
+        elif block_type == RAR4_END_HEADER:
+            return VolumeInfo(next_volume=bool(flags & RAR4_END_NEXT_VOLUME))
+        elif block_type == RAR4_FILE_HEADER:
+            fields = volume.read(25)
+            data_size = struct.unpack('<I', fields[:4])[0]
+            if flags & RAR4_FILE_LARGE:
+                data_size += struct.unpack('<I', volume.read(4))[0] << 32
+        elif flags & RAR4_LONG_BLOCK:
+            data_size = struct.unpack('<I', volume.read(4))[0]
+
+        position = start + header_size + data_size
+        if position > size:
+            raise struct.error('truncated volume')
+        volume.seek(position)
+
+
+def _read_rar5(volume, size):
+    number = 0
+    while True:
+        start = volume.tell()
+        if not volume.read(4):
+            return VolumeInfo(number)
+
+        header_size = _read_vint(volume)
+        header_start = volume.tell()
+        header_type = _read_vint(volume)
+        flags = _read_vint(volume)
+        if flags & RAR5_EXTRA_AREA:
+            _read_vint(volume)
+        data_size = _read_vint(volume) if flags & RAR5_DATA_AREA else 0
+
+        if header_type == RAR5_ENCRYPTION_HEADER:
+            return VolumeInfo(number)
+        elif header_type == RAR5_MAIN_HEADER:
+            archive_flags = _read_vint(volume)
+            if archive_flags & RAR5_MAIN_VOLUME_NUMBER:
+                number = _read_vint(volume)
+        elif header_type == RAR5_END_HEADER:
+            end_flags = _read_vint(volume)
+            return VolumeInfo(number, bool(end_flags & RAR5_END_NEXT_VOLUME))
+
+        position = header_start + header_size + data_size
+        if header_size == 0 or position > size or position <= start:
+            raise struct.error('truncated volume')
+        volume.seek(position)
+
+
+def _read_vint(volume):
+    value = 0
+    for shift in range(0, 70, 7):
+        byte = volume.read(1)
+        if not byte:
+            raise struct.error('truncated header')
+        byte = ord(byte)
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value
+    raise struct.error('invalid variable length integer')